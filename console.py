@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Console Input
+Prompts that can be awaited without blocking the event loop
+"""
+
+import asyncio
+import threading
+
+
+async def ainput(prompt=""):
+    """input() that runs on a daemon thread so the event loop keeps running"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    def _resolve(result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    
+    def _read():
+        try:
+            result, error = input(prompt), None
+        except BaseException as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(_resolve, result, error)
+        except RuntimeError:
+            # The loop has already shut down
+            pass
+    
+    # A daemon thread (rather than asyncio.to_thread) so a pending prompt
+    # never keeps the process alive after Ctrl-C
+    threading.Thread(target=_read, daemon=True).start()
+    return await future
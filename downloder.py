@@ -14,6 +14,12 @@ from telethon.tl.types import (
     Chat,
 )
 
+# orjson is optional; fall back to the stdlib json module without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables
 load_dotenv('.env.local')  # Specify the correct .env file name
 
@@ -22,44 +28,170 @@ api_id = int(os.getenv("API_ID"))
 api_hash = os.getenv("API_HASH")
 session_name = os.getenv("SESSION_NAME", "default_session")
 batch_size = int(os.getenv("BATCH_SIZE", 5))
-
-
-def save_download_state(downloaded_ids, state_file="download_state.json"):
-    """Save downloaded message IDs to JSON file"""
+max_inflight_bytes = int(os.getenv("MAX_INFLIGHT_MB", 512)) * 1024 * 1024
+
+# Dialog entity types that can be downloaded from
+CHANNEL_TYPES = (Channel, Chat)
+
+# Filename prefix and extension for documents sent without a filename
+MIME_FILENAMES = {
+    'application/pdf': ('document', 'pdf'),
+    'application/zip': ('archive', 'zip'),
+    'application/x-zip-compressed': ('archive', 'zip'),
+}
+
+# Menu choice -> (message filter, default folder, server-side search, required mime type).
+# PDFs and ZIPs are matched by extension on the server, then checked by mime type
+CONTENT_CHOICES = {
+    "1": (InputMessagesFilterPhotos, "images", None, None),
+    "2": (InputMessagesFilterVideo, "videos", None, None),
+    "3": (InputMessagesFilterDocument, "pdfs", ".pdf", "application/pdf"),
+    "4": (InputMessagesFilterDocument, "zips", ".zip", "application/zip"),
+    "5": (None, "all_media", None, None),
+}
+
+# Largest chunk Telethon will request per GetFileRequest
+DOWNLOAD_REQUEST_SIZE = 512 * 1024
+
+
+class ByteBudget:
+    """Admission control that caps the total size of downloads in flight"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+        # Waiters are admitted in arrival order so large files aren't starved
+        self._turn = asyncio.Lock()
+
+    def _charge(self, nbytes):
+        # A file bigger than the whole budget still runs, just on its own
+        return min(nbytes, self.max_bytes)
+
+    async def acquire(self, nbytes):
+        nbytes = self._charge(nbytes)
+        async with self._turn:
+            async with self._cond:
+                await self._cond.wait_for(lambda: self.in_flight + nbytes <= self.max_bytes)
+                self.in_flight += nbytes
+
+    async def release(self, nbytes):
+        async with self._cond:
+            self.in_flight -= self._charge(nbytes)
+            self._cond.notify_all()
+
+
+def save_download_state(downloaded_ids, state_file="download_state.log"):
+    """Compact the state log by atomically rewriting it from the ID set"""
+    tmp_file = f"{state_file}.tmp"
     try:
-        with open(state_file, 'w') as f:
-            json.dump(list(downloaded_ids), f)
+        with open(tmp_file, 'w') as f:
+            f.writelines(f"{message_id}\n" for message_id in downloaded_ids)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, state_file)
     except Exception as e:
         print(f"{Fore.YELLOW}Warning: Could not save download state: {e}{Style.RESET_ALL}")
 
 
-def load_download_state(state_file="download_state.json"):
-    """Load downloaded message IDs from JSON file"""
+def load_download_state(state_file="download_state.log"):
+    """Load downloaded message IDs from the state log"""
+    downloaded_ids = set()
+
+    # Pick up state written by older versions as a JSON list
+    legacy_file = os.path.splitext(state_file)[0] + ".json"
+    try:
+        with open(legacy_file, 'rb') as f:
+            raw = f.read()
+        downloaded_ids.update(orjson.loads(raw) if orjson else json.loads(raw))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"{Fore.YELLOW}Warning: Could not load legacy download state: {e}{Style.RESET_ALL}")
+
     try:
         with open(state_file, 'r') as f:
-            return set(json.load(f))
+            for line in f:
+                # Ignore a torn final line left behind by an interrupted write
+                if line.endswith('\n') and line.strip():
+                    downloaded_ids.add(int(line))
     except FileNotFoundError:
-        return set()
+        pass
     except Exception as e:
         print(f"{Fore.YELLOW}Warning: Could not load download state: {e}{Style.RESET_ALL}")
-        return set()
+
+    return downloaded_ids
+
+
+def _append_ids(f, message_ids, sync):
+    f.writelines(f"{message_id}\n" for message_id in message_ids)
+    f.flush()
+    if sync:
+        os.fsync(f.fileno())
+
+
+async def state_writer(queue, downloaded_ids, state_file, fsync_every=50, compact_every=1000):
+    """Drain downloaded message IDs from the queue into the append-only state log"""
+    f = await asyncio.to_thread(open, state_file, 'a')
+    unsynced = 0
+    appended = 0
+    done = False
+
+    try:
+        while not done:
+            # Take whatever has queued up so one thread hop covers many IDs
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            if None in batch:
+                done = True
+                batch = [message_id for message_id in batch if message_id is not None]
+            if not batch:
+                continue
+
+            unsynced += len(batch)
+            appended += len(batch)
+            sync = unsynced >= fsync_every
+            await asyncio.to_thread(_append_ids, f, batch, sync)
+            if sync:
+                unsynced = 0
+
+            if appended >= compact_every:
+                await asyncio.to_thread(f.close)
+                await asyncio.to_thread(save_download_state, set(downloaded_ids), state_file)
+                f = await asyncio.to_thread(open, state_file, 'a')
+                appended = 0
+    finally:
+        await asyncio.to_thread(f.close)
+
+    await asyncio.to_thread(save_download_state, set(downloaded_ids), state_file)
 
 
 def get_filename_from_message(message):
-    """Extract filename from message"""
+    """Extract filename from message (cached on the message object)"""
+    cached = getattr(message, '_cached_filename', None)
+    if cached:
+        return cached
+    name = _resolve_filename(message)
+    message._cached_filename = name
+    return name
+
+
+def _resolve_filename(message):
+    """Work out the filename for a message without caching"""
     if message.document:
         # Try to get original filename
+        filename_attr = DocumentAttributeFilename
         for attr in message.document.attributes:
-            if isinstance(attr, DocumentAttributeFilename):
+            if type(attr) is filename_attr:
                 return attr.file_name
         # Fallback to generic name based on mime type
-        if message.document.mime_type:
-            ext = message.document.mime_type.split('/')[-1]
-            if ext == 'pdf':
-                return f"document_{message.id}.pdf"
-            elif ext in ['zip', 'x-zip-compressed']:
-                return f"archive_{message.id}.zip"
-            elif 'video' in message.document.mime_type:
+        mime = message.document.mime_type
+        if mime:
+            known = MIME_FILENAMES.get(mime)
+            if known:
+                return f"{known[0]}_{message.id}.{known[1]}"
+            if mime.startswith('video/'):
                 return f"video_{message.id}.mp4"
         return f"document_{message.id}.bin"
     elif message.video:
@@ -70,23 +202,27 @@ def get_filename_from_message(message):
         return f"media_{message.id}.bin"
 
 
-def is_file_already_downloaded(message, folder_path):
+def scan_existing_files(folder_path):
+    """Return the set of file names already present in the folder"""
+    with os.scandir(folder_path) as entries:
+        return {entry.name for entry in entries}
+
+
+def is_file_already_downloaded(message, existing_files):
     """Check if file already exists in the folder"""
-    filename = get_filename_from_message(message)
-    file_path = os.path.join(folder_path, filename)
-    return os.path.exists(file_path)
+    return get_filename_from_message(message) in existing_files
 
 
 async def list_user_channels(client):
     """List all channels and groups the user has access to"""
     print(f"{Fore.YELLOW}Fetching your channels and groups...{Style.RESET_ALL}")
     
-    dialogs = await client.get_dialogs()
     channels = []
     
-    for dialog in dialogs:
+    # Stream dialogs page by page rather than materializing the full list
+    async for dialog in client.iter_dialogs():
         entity = dialog.entity
-        if isinstance(entity, (Channel, Chat)):
+        if isinstance(entity, CHANNEL_TYPES):
             # Only include channels and groups, not private chats
             if hasattr(entity, 'username') and entity.username:
                 channels.append({
@@ -149,74 +285,107 @@ async def display_and_select_channel(client):
             print(f"{Fore.YELLOW}Please try another selection.{Style.RESET_ALL}")
 
 
-async def download_file(message, folder_name, progress_bars, downloaded_ids):
+async def stream_document(message, file_path, file_size, progress_callback):
+    """Stream a document to disk in large requests, writing from a worker thread"""
+    part_path = f"{file_path}.part"
+    f = await asyncio.to_thread(open, part_path, 'wb')
     try:
-        # Check if file already exists
-        if is_file_already_downloaded(message, folder_name):
-            filename = get_filename_from_message(message)
-            print(f"{Fore.YELLOW}Skipping {filename} - already downloaded{Style.RESET_ALL}")
-            downloaded_ids.add(message.id)
-            return
-        
-        # Get the file size
-        file_size = (
-            message.video.size
-            if message.video
-            else message.document.size if message.document else 0
-        )
+        received = 0
+        async for chunk in message.client.iter_download(
+            message.document, request_size=DOWNLOAD_REQUEST_SIZE, file_size=file_size
+        ):
+            await asyncio.to_thread(f.write, chunk)
+            received += len(chunk)
+            progress_callback(received, file_size)
+    finally:
+        await asyncio.to_thread(f.close)
+    # Only expose the final name once the file is complete
+    await asyncio.to_thread(os.replace, part_path, file_path)
+
+
+def get_file_size(message):
+    """Size in bytes of the media attached to a message"""
+    if message.video:
+        return message.video.size
+    if message.document:
+        return message.document.size
+    return message.file.size if message.file and message.file.size else 0
+
 
+async def download_file(message, folder_name, progress_bar, downloaded_ids, existing_files):
+    # Callers only pass messages that aren't on disk yet (see main's filter pass)
+    try:
+        file_size = get_file_size(message)
         filename = get_filename_from_message(message)
-        # Initialize the progress bar
-        progress_bar = tqdm(
-            total=file_size,
-            desc=f"Downloading {filename[:20]}...",
-            ncols=100,
-            unit="B",
-            unit_scale=True,
-            leave=True,  # Keep progress bar visible after completion
-            bar_format=(
-                "{l_bar}%s{bar}%s| {n_fmt}/{total_fmt} {unit} "
-                "| Elapsed: {elapsed}/{remaining} | {rate_fmt}"
-                % (Fore.BLUE, Style.RESET_ALL)
-            ),
-        )
-        progress_bars.append(progress_bar)
 
-        # Download media with progress
-        await message.download_media(
-            file=f"./{folder_name}/",
-            progress_callback=lambda current, total: (
-                progress_bar.update(current - progress_bar.n) if total else None
-            ),
-        )
+        # Feed this file's progress into the shared bar as deltas
+        received = [0]
 
-        # After download finishes, change the color to green
-        progress_bar.bar_format = (
-            "{l_bar}%s{bar}%s| {n_fmt}/{total_fmt} {unit} "
-            "| Elapsed: {elapsed}/{rate_fmt}" % (Fore.GREEN, Style.RESET_ALL)
-        )
-        progress_bar.set_description(f"Finished {filename[:20]}...")
-        progress_bar.n = progress_bar.total  # Ensure the progress bar shows 100%
-        progress_bar.update(0)  # Force update to display the changes
+        def progress_callback(current, total):
+            progress_bar.update(current - received[0])
+            received[0] = current
+
+        file_path = os.path.join(folder_name, filename)
+
+        # Download media with progress
+        if message.document:
+            await stream_document(message, file_path, file_size, progress_callback)
+        else:
+            await message.download_media(
+                file=file_path,
+                progress_callback=progress_callback,
+            )
+
+        # Account for any bytes the callback didn't report
+        if file_size > received[0]:
+            progress_bar.update(file_size - received[0])
+        tqdm.write(f"{Fore.GREEN}✓ {filename}{Style.RESET_ALL}")
         
         # Mark as downloaded
         downloaded_ids.add(message.id)
+        existing_files.add(filename)
 
     except Exception as e:
-        print(f"Error downloading media: {e}")
-
-
-async def download_in_batches(messages, folder_name, batch_size, downloaded_ids, state_file):
-    tasks = []
-    progressbar = []
-    for i, message in enumerate(messages, 1):
-        tasks.append(download_file(message, folder_name, progressbar, downloaded_ids))
-        # Run in batches of batch_size
-        if len(tasks) == batch_size or i == len(messages):
-            await asyncio.gather(*tasks)
-            # Save state after each batch
-            save_download_state(downloaded_ids, state_file)
-            tasks.clear()  # Clear tasks after each batch
+        tqdm.write(f"Error downloading media: {e}")
+
+
+async def download_in_batches(messages, folder_name, batch_size, downloaded_ids, existing_files, state_file, max_bytes=max_inflight_bytes):
+    """Download messages, bounded by both file count and total bytes in flight"""
+    sem = asyncio.Semaphore(batch_size)
+    budget = ByteBudget(max_bytes)
+    # One aggregate bar for the whole run instead of one per file
+    progress_bar = tqdm(
+        total=sum(get_file_size(message) for message in messages),
+        desc="Downloading",
+        ncols=100,
+        unit="B",
+        unit_scale=True,
+    )
+    state_queue = asyncio.Queue()
+
+    async def _guarded(message):
+        # Each download frees its slot as soon as it finishes, so the next
+        # message starts without waiting for the rest of a batch
+        file_size = get_file_size(message)
+        await budget.acquire(file_size)
+        try:
+            async with sem:
+                await download_file(message, folder_name, progress_bar, downloaded_ids, existing_files)
+        finally:
+            await budget.release(file_size)
+        if message.id in downloaded_ids:
+            state_queue.put_nowait(message.id)
+
+    writer = asyncio.create_task(state_writer(state_queue, downloaded_ids, state_file))
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for message in messages:
+                tg.create_task(_guarded(message))
+    finally:
+        progress_bar.close()
+        # Flush remaining IDs and compact the log once all downloads have settled
+        state_queue.put_nowait(None)
+        await writer
 
 
 async def main():
@@ -233,6 +402,9 @@ async def main():
             f"{Fore.YELLOW}Selected channel: {channel.title} (ID: {channel.id}){Style.RESET_ALL}"
         )
 
+        # Resolve the peer once; Telethon requests take it without further lookups
+        input_peer = await client.get_input_entity(channel)
+
         # Prompt the user for their choice
         print(
             f"{Fore.CYAN}Choose the type of content to download:{Style.RESET_ALL}\n"
@@ -244,24 +416,12 @@ async def main():
         )
         choice = input(f"{Fore.CYAN}Enter your choice (1-5): {Style.RESET_ALL}")
 
-        default_folder_name = ""
-        filter_type = None
-
-        if choice == "1":
-            filter_type = InputMessagesFilterPhotos()
-            default_folder_name = "images"
-        elif choice == "2":
-            filter_type = InputMessagesFilterVideo()
-            default_folder_name = "videos"
-        elif choice in ["3", "4"]:
-            filter_type = InputMessagesFilterDocument()
-            default_folder_name = "pdfs" if choice == "3" else "zips"
-        elif choice == "5":
-            filter_type = None
-            default_folder_name = "all_media"
-        else:
+        content = CONTENT_CHOICES.get(choice)
+        if content is None:
             print(f"{Fore.RED}Invalid choice! Exiting...{Style.RESET_ALL}")
             return
+        filter_cls, default_folder_name, search_query, target_mime = content
+        filter_type = filter_cls() if filter_cls else None
 
         # Custom folder naming
         print(f"\n{Fore.CYAN}Folder Configuration:{Style.RESET_ALL}")
@@ -279,34 +439,36 @@ async def main():
         else:
             print(f"{Fore.GREEN}Using existing folder: {download_path}{Style.RESET_ALL}")
 
+        # Index the folder once instead of stat()ing every message
+        existing_files = await asyncio.to_thread(scan_existing_files, download_path)
+
         # Load download state
-        state_file = f"downloads/{folder_name}/download_state.json"
-        downloaded_ids = load_download_state(state_file)
+        state_file = f"downloads/{folder_name}/download_state.log"
+        downloaded_ids = await asyncio.to_thread(load_download_state, state_file)
         
         print(f"{Fore.YELLOW}Fetching media messages...{Style.RESET_ALL}")
         media_messages = await client.get_messages(
-            channel, filter=filter_type, limit=2000
+            input_peer, filter=filter_type, search=search_query, limit=2000
         )
 
-        if choice == "3":
-            media_messages = [
-                msg
-                for msg in media_messages
-                if msg.document and msg.document.mime_type == "application/pdf"
-            ]
-        elif choice == "4":
-            media_messages = [
-                msg
-                for msg in media_messages
-                if msg.document and msg.document.mime_type == "application/zip"
-            ]
-
-        # Filter out already downloaded messages
-        original_count = len(media_messages)
-        media_messages = [
-            msg for msg in media_messages 
-            if msg.id not in downloaded_ids and not is_file_already_downloaded(msg, download_path)
-        ]
+        # Single pass: apply the mime filter and drop anything already downloaded
+        original_count = 0
+        new_messages = []
+        append = new_messages.append
+        for msg in media_messages:
+            if target_mime:
+                document = msg.document
+                if not document or document.mime_type != target_mime:
+                    continue
+            original_count += 1
+            message_id = msg.id
+            if message_id in downloaded_ids:
+                continue
+            if is_file_already_downloaded(msg, existing_files):
+                downloaded_ids.add(message_id)
+                continue
+            append(msg)
+        media_messages = new_messages
         
         already_downloaded = original_count - len(media_messages)
         
@@ -316,7 +478,7 @@ async def main():
         print(f"{Fore.GREEN}{len(media_messages)} new files to download{Style.RESET_ALL}")
 
         if media_messages:
-            await download_in_batches(media_messages, download_path, batch_size, downloaded_ids, state_file)
+            await download_in_batches(media_messages, download_path, batch_size, downloaded_ids, existing_files, state_file)
             print(f"\n{Fore.GREEN}Download completed! Files saved to: {download_path}{Style.RESET_ALL}")
         else:
             if already_downloaded > 0:
@@ -326,4 +488,10 @@ async def main():
 
 
 if __name__ == "__main__":
+    # uvloop is optional and unavailable on Windows
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())
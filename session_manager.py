@@ -8,16 +8,27 @@ import os
 import json
 import asyncio
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
 from pathlib import Path
 from colorama import Fore, Style, init
 from telethon import TelegramClient
-from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError
+from telethon.errors import PhoneCodeInvalidError, PasswordHashInvalidError
+
+# orjson is optional; fall back to the stdlib json module without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Initialize colorama
 init(autoreset=True)
 
-@dataclass
+def _utc_now() -> str:
+    """Current time as an ISO 8601 UTC timestamp"""
+    return datetime.now(timezone.utc).isoformat()
+
+@dataclass(slots=True)
 class SessionInfo:
     """Information about a saved session"""
     name: str
@@ -32,49 +43,90 @@ class SessionInfo:
     is_active: bool = False
     created_at: Optional[str] = None
     last_used: Optional[str] = None
+    
+    def to_dict(self) -> dict:
+        """Shallow field dict; every field is a primitive so asdict's deep copy isn't needed"""
+        return {name: getattr(self, name) for name in _SESSION_FIELDS}
+
+_SESSION_FIELDS = tuple(f.name for f in fields(SessionInfo))
 
 class SessionManager:
     """Manages multiple Telegram sessions"""
     
+    # Saves requested within this window are written out together
+    SAVE_DEBOUNCE = 0.1
+    
     def __init__(self, sessions_dir: str = "sessions", config_file: str = "sessions_config.json"):
         self.sessions_dir = Path(sessions_dir)
         self.config_file = Path(config_file)
         self.sessions: Dict[str, SessionInfo] = {}
         self.current_session: Optional[str] = None
+        self._pending_save: Optional[asyncio.Task] = None
+        self._clients: Dict[str, TelegramClient] = {}
+        self._save_lock = asyncio.Lock()
         
         # Create sessions directory if it doesn't exist
         self.sessions_dir.mkdir(exist_ok=True)
-        
-        # Load existing sessions
-        self.load_sessions()
     
-    def load_sessions(self) -> None:
-        """Load sessions from config file"""
-        if self.config_file.exists():
-            try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.sessions = {
-                        name: SessionInfo(**info) 
-                        for name, info in data.get('sessions', {}).items()
-                    }
-                    self.current_session = data.get('current_session')
-                    print(f"{Fore.GREEN}✓ Loaded {len(self.sessions)} saved sessions{Style.RESET_ALL}")
-            except Exception as e:
-                print(f"{Fore.YELLOW}⚠ Warning: Could not load sessions config: {e}{Style.RESET_ALL}")
-                self.sessions = {}
+    @classmethod
+    async def create(cls, *args, **kwargs) -> "SessionManager":
+        """Create a session manager and load existing sessions"""
+        manager = cls(*args, **kwargs)
+        await manager.load_sessions()
+        return manager
     
-    def save_sessions(self) -> None:
-        """Save sessions to config file"""
+    def _read_config(self) -> Optional[dict]:
+        if not self.config_file.exists():
+            return None
+        with open(self.config_file, 'rb') as f:
+            raw = f.read()
+        return orjson.loads(raw) if orjson else json.loads(raw)
+    
+    def _write_config(self, data: dict) -> None:
+        if orjson:
+            payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+        else:
+            payload = json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        with open(self.config_file, 'wb') as f:
+            f.write(payload)
+    
+    async def load_sessions(self) -> None:
+        """Load sessions from config file"""
         try:
-            data = {
-                'sessions': {name: asdict(info) for name, info in self.sessions.items()},
-                'current_session': self.current_session
-            }
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            data = await asyncio.to_thread(self._read_config)
+            if data is not None:
+                self.sessions = {
+                    name: SessionInfo(**info) 
+                    for name, info in data.get('sessions', {}).items()
+                }
+                self.current_session = data.get('current_session')
+                print(f"{Fore.GREEN}✓ Loaded {len(self.sessions)} saved sessions{Style.RESET_ALL}")
         except Exception as e:
-            print(f"{Fore.RED}✗ Error saving sessions config: {e}{Style.RESET_ALL}")
+            print(f"{Fore.YELLOW}⚠ Warning: Could not load sessions config: {e}{Style.RESET_ALL}")
+            self.sessions = {}
+    
+    async def save_sessions(self) -> None:
+        """Save sessions to config file"""
+        # Join a save that hasn't taken its snapshot yet, otherwise schedule a new one
+        task = self._pending_save
+        if task is None:
+            task = self._pending_save = asyncio.create_task(self._flush_sessions())
+        await asyncio.shield(task)
+    
+    async def _flush_sessions(self) -> None:
+        """Write the config file once the debounce window has passed"""
+        await asyncio.sleep(self.SAVE_DEBOUNCE)
+        async with self._save_lock:
+            # Requests arriving from here on need a fresh snapshot
+            self._pending_save = None
+            try:
+                data = {
+                    'sessions': {name: info.to_dict() for name, info in self.sessions.items()},
+                    'current_session': self.current_session
+                }
+                await asyncio.to_thread(self._write_config, data)
+            except Exception as e:
+                print(f"{Fore.RED}✗ Error saving sessions config: {e}{Style.RESET_ALL}")
     
     def list_sessions(self) -> None:
         """Display all available sessions"""
@@ -109,9 +161,14 @@ class SessionManager:
         try:
             print(f"{Fore.CYAN}🔐 Logging into Telegram account...{Style.RESET_ALL}")
             
+            def prompt_password() -> str:
+                print(f"{Fore.YELLOW}🔑 Two-factor authentication is enabled. Please enter your password:{Style.RESET_ALL}")
+                return input(f"{Fore.CYAN}Password: {Style.RESET_ALL}")
+            
             async with TelegramClient(session_file, api_id, api_hash) as client:
-                # Start the client (this will prompt for phone and code)
-                await client.start(phone=phone_number)
+                # Start the client (this will prompt for the code, and the
+                # password on the same connection if 2FA is enabled)
+                await client.start(phone=phone_number, password=prompt_password)
                 
                 # Get user information
                 me = await client.get_me()
@@ -127,56 +184,28 @@ class SessionManager:
                     username=me.username,
                     first_name=me.first_name,
                     last_name=me.last_name,
-                    created_at=str(asyncio.get_event_loop().time())
+                    created_at=_utc_now()
                 )
                 
                 # Save session
                 self.sessions[name] = session_info
-                self.save_sessions()
+                await self.save_sessions()
                 
                 print(f"{Fore.GREEN}✓ Session '{name}' added successfully!{Style.RESET_ALL}")
                 print(f"{Fore.GREEN}  User: {me.first_name} {me.last_name or ''} (@{me.username or 'no_username'}){Style.RESET_ALL}")
                 return True
                 
-        except SessionPasswordNeededError:
-            print(f"{Fore.RED}✗ Two-factor authentication is enabled. Please enter your password:{Style.RESET_ALL}")
-            password = input(f"{Fore.CYAN}Password: {Style.RESET_ALL}")
-            
-            try:
-                async with TelegramClient(session_file, api_id, api_hash) as client:
-                    await client.start(phone=phone_number, password=password)
-                    me = await client.get_me()
-                    
-                    session_info = SessionInfo(
-                        name=name,
-                        phone_number=phone_number,
-                        api_id=api_id,
-                        api_hash=api_hash,
-                        session_file=session_file,
-                        user_id=me.id,
-                        username=me.username,
-                        first_name=me.first_name,
-                        last_name=me.last_name,
-                        created_at=str(asyncio.get_event_loop().time())
-                    )
-                    
-                    self.sessions[name] = session_info
-                    self.save_sessions()
-                    
-                    print(f"{Fore.GREEN}✓ Session '{name}' added successfully!{Style.RESET_ALL}")
-                    return True
-            except Exception as e:
-                print(f"{Fore.RED}✗ Failed to login with password: {e}{Style.RESET_ALL}")
-                return False
-                
         except PhoneCodeInvalidError:
             print(f"{Fore.RED}✗ Invalid verification code{Style.RESET_ALL}")
             return False
+        except PasswordHashInvalidError:
+            print(f"{Fore.RED}✗ Failed to login with password: invalid password{Style.RESET_ALL}")
+            return False
         except Exception as e:
             print(f"{Fore.RED}✗ Failed to add session: {e}{Style.RESET_ALL}")
             return False
     
-    def switch_session(self, session_name: str) -> bool:
+    async def switch_session(self, session_name: str) -> bool:
         """Switch to a different session"""
         if session_name not in self.sessions:
             print(f"{Fore.RED}✗ Session '{session_name}' not found{Style.RESET_ALL}")
@@ -193,9 +222,9 @@ class SessionManager:
         self.current_session = session_name
         
         # Update last used time
-        self.sessions[session_name].last_used = str(asyncio.get_event_loop().time())
+        self.sessions[session_name].last_used = _utc_now()
         
-        self.save_sessions()
+        await self.save_sessions()
         
         session_info = self.sessions[session_name]
         print(f"{Fore.GREEN}✓ Switched to session '{session_name}'{Style.RESET_ALL}")
@@ -206,7 +235,7 @@ class SessionManager:
         
         return True
     
-    def remove_session(self, session_name: str) -> bool:
+    async def remove_session(self, session_name: str) -> bool:
         """Remove a session"""
         if session_name not in self.sessions:
             print(f"{Fore.RED}✗ Session '{session_name}' not found{Style.RESET_ALL}")
@@ -220,6 +249,9 @@ class SessionManager:
             print(f"{Fore.YELLOW}Deletion cancelled{Style.RESET_ALL}")
             return False
         
+        # Release the pooled connection before deleting its session file
+        await self._close_client(session_name)
+        
         # Remove session file
         try:
             if Path(session_info.session_file).exists():
@@ -234,7 +266,7 @@ class SessionManager:
         if self.current_session == session_name:
             self.current_session = None
         
-        self.save_sessions()
+        await self.save_sessions()
         
         print(f"{Fore.GREEN}✓ Session '{session_name}' removed{Style.RESET_ALL}")
         return True
@@ -245,7 +277,7 @@ class SessionManager:
             return self.sessions[self.current_session]
         return None
     
-    async def get_client(self, session_name: Optional[str] = None) -> Optional[TelegramClient]:
+    async def get_client(self, session_name: Optional[str] = None, allow_login: bool = True) -> Optional[TelegramClient]:
         """Get a Telegram client for the specified or current session"""
         target_session = session_name or self.current_session
         
@@ -256,21 +288,92 @@ class SessionManager:
         session_info = self.sessions[target_session]
         
         try:
-            client = TelegramClient(
-                session_info.session_file,
-                session_info.api_id,
-                session_info.api_hash
-            )
+            # Reuse the pooled client so repeated calls skip the handshake
+            client = self._clients.get(target_session)
+            if client is None:
+                client = TelegramClient(
+                    session_info.session_file,
+                    session_info.api_id,
+                    session_info.api_hash,
+                    # Pooled clients live long; ride out short flood waits
+                    flood_sleep_threshold=60
+                )
+                self._clients[target_session] = client
             
-            await client.start()
+            if not client.is_connected():
+                await client.connect()
+                if not await client.is_user_authorized():
+                    if not allow_login:
+                        raise RuntimeError("session is no longer authorized")
+                    await client.start()
             return client
             
         except Exception as e:
+            await self._close_client(target_session)
             print(f"{Fore.RED}✗ Failed to connect with session '{target_session}': {e}{Style.RESET_ALL}")
             return None
     
+    async def _close_client(self, session_name: str) -> None:
+        """Disconnect and forget the pooled client for a session"""
+        client = self._clients.pop(session_name, None)
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+    
+    async def close_all(self) -> None:
+        """Disconnect every pooled client"""
+        for session_name in list(self._clients):
+            await self._close_client(session_name)
+    
+    async def refresh_all(self, max_concurrency: int = 5) -> int:
+        """Refresh profile details for every session in parallel"""
+        sem = asyncio.Semaphore(max_concurrency)
+        
+        async def _bounded(name: str) -> bool:
+            async with sem:
+                return await self._refresh_one(name)
+        
+        results = await asyncio.gather(*(_bounded(name) for name in list(self.sessions)))
+        refreshed = sum(results)
+        if refreshed:
+            await self.save_sessions()
+        return refreshed
+    
+    async def _refresh_one(self, session_name: str) -> bool:
+        """Update a session's stored profile from get_me()"""
+        # Never prompt for a login here; prompts from parallel tasks would interleave
+        client = await self.get_client(session_name, allow_login=False)
+        if not client:
+            return False
+        
+        try:
+            me = await client.get_me()
+        except Exception as e:
+            print(f"{Fore.YELLOW}⚠ Could not refresh '{session_name}': {e}{Style.RESET_ALL}")
+            return False
+        
+        info = self.sessions.get(session_name)
+        if info is None:
+            return False
+        info.user_id = me.id
+        info.username = me.username
+        info.first_name = me.first_name
+        info.last_name = me.last_name
+        return True
+    
     async def interactive_session_menu(self) -> None:
         """Interactive menu for session management"""
+        menu = {
+            "1": self.list_sessions,
+            "2": self._add_session_interactive,
+            "3": self._switch_session_interactive,
+            "4": self._remove_session_interactive,
+            "5": self._test_session,
+            "6": self._refresh_sessions_interactive,
+        }
+        
         while True:
             print(f"\n{Fore.CYAN}📱 Telegram Session Manager{Style.RESET_ALL}")
             print(f"{Fore.CYAN}{'='*40}{Style.RESET_ALL}")
@@ -287,24 +390,21 @@ class SessionManager:
             print("3. Switch session")
             print("4. Remove session")
             print("5. Test current session")
+            print("6. Refresh account details")
             print("0. Exit")
             
-            choice = input(f"\n{Fore.CYAN}Enter your choice (0-5): {Style.RESET_ALL}").strip()
+            choice = input(f"\n{Fore.CYAN}Enter your choice (0-6): {Style.RESET_ALL}").strip()
             
             if choice == "0":
                 break
-            elif choice == "1":
-                self.list_sessions()
-            elif choice == "2":
-                await self._add_session_interactive()
-            elif choice == "3":
-                self._switch_session_interactive()
-            elif choice == "4":
-                self._remove_session_interactive()
-            elif choice == "5":
-                await self._test_session()
-            else:
+            
+            action = menu.get(choice)
+            if action is None:
                 print(f"{Fore.RED}Invalid choice!{Style.RESET_ALL}")
+            elif asyncio.iscoroutinefunction(action):
+                await action()
+            else:
+                action()
     
     async def _add_session_interactive(self) -> None:
         """Interactive session addition"""
@@ -333,7 +433,7 @@ class SessionManager:
         except ValueError:
             print(f"{Fore.RED}Invalid API ID{Style.RESET_ALL}")
     
-    def _switch_session_interactive(self) -> None:
+    async def _switch_session_interactive(self) -> None:
         """Interactive session switching"""
         if not self.sessions:
             print(f"{Fore.YELLOW}No sessions available{Style.RESET_ALL}")
@@ -344,9 +444,9 @@ class SessionManager:
         
         session_name = input(f"\n{Fore.CYAN}Enter session name: {Style.RESET_ALL}").strip()
         if session_name:
-            self.switch_session(session_name)
+            await self.switch_session(session_name)
     
-    def _remove_session_interactive(self) -> None:
+    async def _remove_session_interactive(self) -> None:
         """Interactive session removal"""
         if not self.sessions:
             print(f"{Fore.YELLOW}No sessions available{Style.RESET_ALL}")
@@ -357,7 +457,17 @@ class SessionManager:
         
         session_name = input(f"\n{Fore.CYAN}Enter session name to remove: {Style.RESET_ALL}").strip()
         if session_name:
-            self.remove_session(session_name)
+            await self.remove_session(session_name)
+    
+    async def _refresh_sessions_interactive(self) -> None:
+        """Interactive refresh of stored account details"""
+        if not self.sessions:
+            print(f"{Fore.YELLOW}No sessions available{Style.RESET_ALL}")
+            return
+        
+        print(f"\n{Fore.CYAN}🔄 Refreshing {len(self.sessions)} sessions...{Style.RESET_ALL}")
+        refreshed = await self.refresh_all()
+        print(f"{Fore.GREEN}✓ Refreshed {refreshed}/{len(self.sessions)} sessions{Style.RESET_ALL}")
     
     async def _test_session(self) -> None:
         """Test current session connection"""
@@ -375,7 +485,6 @@ class SessionManager:
                 print(f"{Fore.GREEN}✓ Connection successful!{Style.RESET_ALL}")
                 print(f"{Fore.GREEN}  User: {me.first_name} {me.last_name or ''} (@{me.username or 'no_username'}){Style.RESET_ALL}")
                 print(f"{Fore.GREEN}  Phone: {me.phone}{Style.RESET_ALL}")
-                await client.disconnect()
             else:
                 print(f"{Fore.RED}✗ Connection failed{Style.RESET_ALL}")
         except Exception as e:
@@ -384,10 +493,19 @@ class SessionManager:
 
 async def main():
     """Main function for standalone session manager"""
-    manager = SessionManager()
-    await manager.interactive_session_menu()
+    manager = await SessionManager.create()
+    try:
+        await manager.interactive_session_menu()
+    finally:
+        await manager.close_all()
     print(f"\n{Fore.CYAN}👋 Session Manager closed{Style.RESET_ALL}")
 
 
 if __name__ == "__main__":
+    # uvloop is optional and unavailable on Windows
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())
\ No newline at end of file
@@ -15,6 +15,7 @@ src_path = os.path.join(os.path.dirname(__file__), 'src')
 sys.path.append(src_path)
 
 from session_manager import SessionManager
+from console import ainput
 
 # Initialize colorama
 init(autoreset=True)
@@ -30,52 +31,56 @@ def display_header():
 
 async def main_menu():
     """Main application menu"""
-    session_manager = SessionManager()
+    session_manager = await SessionManager.create()
     
-    while True:
-        display_header()
-        
-        # Show current session
-        current = session_manager.get_current_session()
-        if current:
-            print(f"{Fore.GREEN}📱 Current Account: {current.first_name} {current.last_name or ''} ({current.phone_number}){Style.RESET_ALL}")
-        else:
-            print(f"{Fore.YELLOW}📱 No active session{Style.RESET_ALL}")
-        
-        print(f"\n{Fore.CYAN}What would you like to do?{Style.RESET_ALL}")
-        print("1. 📤 Upload files (current session)")
-        print("2. 📥 Download files (current session)")
-        print("3. 🔄 Switch to different account")
-        print("4. ➕ Add new account")
-        print("5. ⚙️  Manage sessions")
-        print("0. 🚪 Exit")
-        
-        choice = input(f"\n{Fore.CYAN}Enter your choice (0-5): {Style.RESET_ALL}").strip()
-        
-        if choice == "0":
-            print(f"{Fore.YELLOW}Goodbye! 👋{Style.RESET_ALL}")
-            break
-        elif choice == "1":
+    try:
+        while True:
+            display_header()
+            
+            # Show current session
+            current = session_manager.get_current_session()
             if current:
-                await run_uploader()
+                print(f"{Fore.GREEN}📱 Current Account: {current.first_name} {current.last_name or ''} ({current.phone_number}){Style.RESET_ALL}")
             else:
-                print(f"{Fore.RED}❌ No active session. Please switch to an account first.{Style.RESET_ALL}")
-                input("Press Enter to continue...")
-        elif choice == "2":
-            if current:
-                await run_downloader()
+                print(f"{Fore.YELLOW}📱 No active session{Style.RESET_ALL}")
+            
+            print(f"\n{Fore.CYAN}What would you like to do?{Style.RESET_ALL}")
+            print("1. 📤 Upload files (current session)")
+            print("2. 📥 Download files (current session)")
+            print("3. 🔄 Switch to different account")
+            print("4. ➕ Add new account")
+            print("5. ⚙️  Manage sessions")
+            print("0. 🚪 Exit")
+            
+            choice = (await ainput(f"\n{Fore.CYAN}Enter your choice (0-5): {Style.RESET_ALL}")).strip()
+            
+            if choice == "0":
+                print(f"{Fore.YELLOW}Goodbye! 👋{Style.RESET_ALL}")
+                break
+            elif choice == "1":
+                if current:
+                    await run_uploader(session_manager)
+                else:
+                    print(f"{Fore.RED}❌ No active session. Please switch to an account first.{Style.RESET_ALL}")
+                    await ainput("Press Enter to continue...")
+            elif choice == "2":
+                if current:
+                    await run_downloader()
+                else:
+                    print(f"{Fore.RED}❌ No active session. Please switch to an account first.{Style.RESET_ALL}")
+                    await ainput("Press Enter to continue...")
+            elif choice == "3":
+                await switch_session(session_manager)
+            elif choice == "4":
+                await add_new_session(session_manager)
+            elif choice == "5":
+                await session_manager.interactive_session_menu()
             else:
-                print(f"{Fore.RED}❌ No active session. Please switch to an account first.{Style.RESET_ALL}")
-                input("Press Enter to continue...")
-        elif choice == "3":
-            await switch_session(session_manager)
-        elif choice == "4":
-            await add_new_session(session_manager)
-        elif choice == "5":
-            await session_manager.interactive_session_menu()
-        else:
-            print(f"{Fore.RED}❌ Invalid choice!{Style.RESET_ALL}")
-            input("Press Enter to continue...")
+                print(f"{Fore.RED}❌ Invalid choice!{Style.RESET_ALL}")
+                await ainput("Press Enter to continue...")
+    finally:
+        # Close the pooled clients however the menu exits (Ctrl-C, errors)
+        await session_manager.close_all()
 
 
 async def switch_session(session_manager):
@@ -84,46 +89,46 @@ async def switch_session(session_manager):
     
     if not session_manager.sessions:
         print(f"{Fore.YELLOW}📭 No sessions available. Add a session first.{Style.RESET_ALL}")
-        input("Press Enter to continue...")
+        await ainput("Press Enter to continue...")
         return
     
     print(f"\n{Fore.CYAN}Available accounts:{Style.RESET_ALL}")
     session_manager.list_sessions()
     
-    session_name = input(f"\n{Fore.CYAN}Enter session name to switch to: {Style.RESET_ALL}").strip()
+    session_name = (await ainput(f"\n{Fore.CYAN}Enter session name to switch to: {Style.RESET_ALL}")).strip()
     
-    if session_name and session_manager.switch_session(session_name):
+    if session_name and await session_manager.switch_session(session_name):
         new_session = session_manager.get_current_session()
         print(f"{Fore.GREEN}✅ Switched to: {new_session.first_name} {new_session.last_name or ''} ({new_session.phone_number}){Style.RESET_ALL}")
     else:
         print(f"{Fore.RED}❌ Failed to switch to '{session_name}'{Style.RESET_ALL}")
     
-    input("Press Enter to continue...")
+    await ainput("Press Enter to continue...")
 
 
 async def add_new_session(session_manager):
     """Add a new session interactively"""
     print(f"\n{Fore.CYAN}➕ Add New Account{Style.RESET_ALL}")
     
-    name = input(f"{Fore.CYAN}Session name (e.g., 'personal', 'work'): {Style.RESET_ALL}").strip()
+    name = (await ainput(f"{Fore.CYAN}Session name (e.g., 'personal', 'work'): {Style.RESET_ALL}")).strip()
     if not name:
         print(f"{Fore.RED}❌ Session name cannot be empty{Style.RESET_ALL}")
-        input("Press Enter to continue...")
+        await ainput("Press Enter to continue...")
         return
     
-    phone = input(f"{Fore.CYAN}Phone number (with country code, e.g., +1234567890): {Style.RESET_ALL}").strip()
+    phone = (await ainput(f"{Fore.CYAN}Phone number (with country code, e.g., +1234567890): {Style.RESET_ALL}")).strip()
     if not phone:
         print(f"{Fore.RED}❌ Phone number cannot be empty{Style.RESET_ALL}")
-        input("Press Enter to continue...")
+        await ainput("Press Enter to continue...")
         return
     
     try:
-        api_id = int(input(f"{Fore.CYAN}API ID: {Style.RESET_ALL}").strip())
-        api_hash = input(f"{Fore.CYAN}API Hash: {Style.RESET_ALL}").strip()
+        api_id = int((await ainput(f"{Fore.CYAN}API ID: {Style.RESET_ALL}")).strip())
+        api_hash = (await ainput(f"{Fore.CYAN}API Hash: {Style.RESET_ALL}")).strip()
         
         if not api_hash:
             print(f"{Fore.RED}❌ API Hash cannot be empty{Style.RESET_ALL}")
-            input("Press Enter to continue...")
+            await ainput("Press Enter to continue...")
             return
         
         print(f"{Fore.YELLOW}🔄 Adding session and connecting...{Style.RESET_ALL}")
@@ -131,7 +136,7 @@ async def add_new_session(session_manager):
         
         if success:
             # Automatically switch to the new session
-            session_manager.switch_session(name)
+            await session_manager.switch_session(name)
             print(f"{Fore.GREEN}✅ Account added and activated successfully!{Style.RESET_ALL}")
         else:
             print(f"{Fore.RED}❌ Failed to add session{Style.RESET_ALL}")
@@ -141,10 +146,10 @@ async def add_new_session(session_manager):
     except Exception as e:
         print(f"{Fore.RED}❌ Error adding session: {e}{Style.RESET_ALL}")
     
-    input("Press Enter to continue...")
+    await ainput("Press Enter to continue...")
 
 
-async def run_uploader():
+async def run_uploader(session_manager):
     """Run the uploader with current session"""
     print(f"\n{Fore.GREEN}🚀 Starting uploader...{Style.RESET_ALL}")
     
@@ -152,16 +157,19 @@ async def run_uploader():
     uploader_path = os.path.join('src', 'uploader.py')
     if os.path.exists(uploader_path):
         try:
-            # Import and run the original uploader
+            # Import and run the original uploader on the session's pooled
+            # connection, which stays open for the rest of the menu
             from src.uploader import main as uploader_main
-            await uploader_main()
+            client = await session_manager.get_client()
+            if client:
+                await uploader_main(client)
         except Exception as e:
             print(f"{Fore.RED}❌ Error running uploader: {e}{Style.RESET_ALL}")
             print(f"{Fore.YELLOW}💡 Try running: python src/uploader.py{Style.RESET_ALL}")
     else:
         print(f"{Fore.RED}❌ Uploader not found at {uploader_path}{Style.RESET_ALL}")
     
-    input("Press Enter to continue...")
+    await ainput("Press Enter to continue...")
 
 
 async def run_downloader():
@@ -181,7 +189,7 @@ async def run_downloader():
     else:
         print(f"{Fore.RED}❌ Downloader not found at {downloader_path}{Style.RESET_ALL}")
     
-    input("Press Enter to continue...")
+    await ainput("Press Enter to continue...")
 
 
 def show_help():
@@ -208,6 +216,13 @@ def show_help():
 
 
 if __name__ == "__main__":
+    # uvloop is optional and unavailable on Windows
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     try:
         # Show help on first run
         if len(sys.argv) > 1 and sys.argv[1] == "--help":
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Upload State
+Tracks which files the uploaders have already sent, as a JSON snapshot plus an append-only log
+"""
+
+import os
+import json
+from colorama import Fore, Style
+
+# orjson is optional; fall back to the stdlib json module without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Files the state helpers leave inside the folder being uploaded, including
+# the temporary snapshot an interrupted save_upload_state leaves behind
+STATE_SUFFIXES = ('_state.json', '_state.log', '_state.json.tmp')
+
+
+def upload_log_path(state_file):
+    """Path of the append-only log that sits next to a state file"""
+    return os.path.splitext(state_file)[0] + ".log"
+
+
+def save_upload_state(uploaded_files, state_file="upload_state.json"):
+    """Save uploaded file paths to JSON file, returning whether it was written"""
+    tmp_file = f"{state_file}.tmp"
+    try:
+        if orjson:
+            payload = orjson.dumps(list(uploaded_files))
+        else:
+            payload = json.dumps(list(uploaded_files)).encode('utf-8')
+        with open(tmp_file, 'wb') as f:
+            f.write(payload)
+        # Swap the snapshot in atomically so a crash never leaves it truncated
+        os.replace(tmp_file, state_file)
+    except Exception as e:
+        print(f"{Fore.YELLOW}Warning: Could not save upload state: {e}{Style.RESET_ALL}")
+        return False
+    return True
+
+
+def compact_upload_state(uploaded_files, state_file="upload_state.json"):
+    """Fold the append-only log into the JSON snapshot and truncate the log"""
+    # Keep the log unless the snapshot now holds everything in it
+    if not save_upload_state(uploaded_files, state_file):
+        return
+    try:
+        open(upload_log_path(state_file), 'w').close()
+    except Exception as e:
+        print(f"{Fore.YELLOW}Warning: Could not truncate upload log: {e}{Style.RESET_ALL}")
+
+
+def load_upload_state(state_file="upload_state.json"):
+    """Load uploaded file paths from the JSON snapshot and the append-only log"""
+    uploaded_files = set()
+    try:
+        with open(state_file, 'rb') as f:
+            raw = f.read()
+        uploaded_files.update(orjson.loads(raw) if orjson else json.loads(raw))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"{Fore.YELLOW}Warning: Could not load upload state: {e}{Style.RESET_ALL}")
+    
+    try:
+        with open(upload_log_path(state_file), 'r', encoding='utf-8') as f:
+            for line in f:
+                # Ignore a torn final line left behind by an interrupted write
+                if line.endswith('\n') and len(line) > 1:
+                    uploaded_files.add(line[:-1])
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"{Fore.YELLOW}Warning: Could not load upload log: {e}{Style.RESET_ALL}")
+    
+    return uploaded_files
@@ -1,6 +1,9 @@
 import asyncio
+import concurrent.futures
 import os
-import json
+import stat
+import sys
+import threading
 from dotenv import load_dotenv
 from colorama import Fore, Style, init
 from tqdm.asyncio import tqdm
@@ -10,6 +13,8 @@ from telethon.tl.types import (
     Chat,
     DocumentAttributeFilename,
 )
+from console import ainput
+from upload_state import STATE_SUFFIXES, compact_upload_state, load_upload_state, upload_log_path
 
 # Initialize colorama
 init(autoreset=True)
@@ -23,53 +28,94 @@ api_hash = os.getenv("API_HASH")
 session_name = os.getenv("SESSION_NAME", "default_session")
 batch_size = int(os.getenv("BATCH_SIZE", 5))
 
+# Flood waits up to this many seconds are slept through automatically
+FLOOD_SLEEP_THRESHOLD = 60
 
-def save_upload_state(uploaded_files, state_file="upload_state.json"):
-    """Save uploaded file paths to JSON file"""
+# Dialog entity types that can be uploaded to
+CHANNEL_TYPES = frozenset((Channel, Chat))
+
+# Extensions of the upload state files, checked before the full suffixes
+_STATE_EXTS = frozenset(('.json', '.log', '.tmp'))
+
+# Marks the end of the file stream for each upload worker
+_END_OF_FILES = None
+
+# Telegram caps an album at ten media items
+ALBUM_SIZE = 10
+# Only these go into albums; Telethon sends .gif/.webp and most other video
+# containers as documents, which Telegram refuses to mix with photos
+ALBUM_EXTS = frozenset(('.jpg', '.jpeg', '.png', '.mp4'))
+
+
+def _iter_files(folder_path, file_types, skip=frozenset(), counts=None):
+    """Yield (path, name, size) for matching files under folder_path using os.scandir
+
+    Paths in skip are counted but not yielded; when counts is given its
+    'found' and 'skipped' entries are incremented as the walk goes.
+    """
     try:
-        with open(state_file, 'w') as f:
-            json.dump(list(uploaded_files), f)
-    except Exception as e:
-        print(f"{Fore.YELLOW}Warning: Could not save upload state: {e}{Style.RESET_ALL}")
+        entries = os.scandir(folder_path)
+    except OSError:
+        # Unreadable directories are skipped, as os.walk does
+        return
+    
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_files(entry.path, file_types, skip, counts)
+            elif entry.is_file():
+                name = entry.name
+                
+                # One scan for the extension serves both the state-file and type checks
+                dot = name.rfind('.')
+                if dot < 0:
+                    if file_types:
+                        continue
+                else:
+                    file_ext = name[dot:].lower()
+                    
+                    # Skip state files
+                    if file_ext in _STATE_EXTS and name.endswith(STATE_SUFFIXES):
+                        continue
+                    
+                    # Filter by file types if specified
+                    if file_types and file_ext not in file_types:
+                        continue
+                
+                path = entry.path
+                if counts is not None:
+                    counts['found'] += 1
+                if path in skip:
+                    if counts is not None:
+                        counts['skipped'] += 1
+                    continue
+                
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    # Let upload_file report the error for this file
+                    size = None
+                yield path, name, size
 
 
-def load_upload_state(state_file="upload_state.json"):
-    """Load uploaded file paths from JSON file"""
+def _regular_stat(path):
+    """Return os.stat(path) if it is a regular file, otherwise None"""
     try:
-        with open(state_file, 'r') as f:
-            return set(json.load(f))
-    except FileNotFoundError:
-        return set()
-    except Exception as e:
-        print(f"{Fore.YELLOW}Warning: Could not load upload state: {e}{Style.RESET_ALL}")
-        return set()
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return st if stat.S_ISREG(st.st_mode) else None
 
 
 def get_files_from_folder(folder_path, file_types=None):
     """Get all files from folder based on file types"""
-    files = []
-    
     if not os.path.exists(folder_path):
         print(f"{Fore.RED}Folder does not exist: {folder_path}{Style.RESET_ALL}")
-        return files
+        return []
     
-    for root, dirs, filenames in os.walk(folder_path):
-        for filename in filenames:
-            file_path = os.path.join(root, filename)
-            
-            # Skip state files
-            if filename.endswith('_state.json'):
-                continue
-                
-            # Filter by file types if specified
-            if file_types:
-                file_ext = os.path.splitext(filename)[1].lower()
-                if file_ext not in file_types:
-                    continue
-            
-            files.append(file_path)
-    
-    return files
+    if file_types:
+        file_types = frozenset(file_types)
+    return [path for path, _, _ in _iter_files(folder_path, file_types)]
 
 
 async def list_user_channels(client):
@@ -78,30 +124,27 @@ async def list_user_channels(client):
     
     dialogs = await client.get_dialogs()
     channels = []
+    append = channels.append
     
     for dialog in dialogs:
         entity = dialog.entity
-        if isinstance(entity, (Channel, Chat)):
-            # Check if user has admin rights or can send messages
-            try:
-                permissions = dialog.entity.default_banned_rights
-                can_send = not (permissions and permissions.send_media)
-                
-                if can_send or hasattr(entity, 'creator') or hasattr(entity, 'admin_rights'):
-                    channels.append({
-                        'title': entity.title,
-                        'username': entity.username if hasattr(entity, 'username') else None,
-                        'id': entity.id,
-                        'type': 'Channel' if isinstance(entity, Channel) else 'Group'
-                    })
-            except:
-                # If we can't check permissions, include it anyway
-                channels.append({
-                    'title': entity.title,
-                    'username': entity.username if hasattr(entity, 'username') else None,
-                    'id': entity.id,
-                    'type': 'Channel' if isinstance(entity, Channel) else 'Group'
-                })
+        entity_type = type(entity)
+        if entity_type not in CHANNEL_TYPES:
+            continue
+        
+        # Check if user has admin rights or can send messages
+        banned = getattr(entity, 'default_banned_rights', None)
+        can_send = not (banned and banned.send_media)
+        if not (can_send or getattr(entity, 'creator', False) or getattr(entity, 'admin_rights', None)):
+            continue
+        
+        append({
+            'title': entity.title,
+            'username': getattr(entity, 'username', None),
+            'id': entity.id,
+            'type': 'Channel' if entity_type is Channel else 'Group',
+            'entity': entity,
+        })
     
     return channels
 
@@ -114,32 +157,36 @@ async def display_and_select_upload_target(client):
         print(f"{Fore.RED}No channels or groups found where you can upload!{Style.RESET_ALL}")
         return None
     
-    print(f"\n{Fore.CYAN}Available channels and groups for upload:{Style.RESET_ALL}")
-    print(f"{Fore.CYAN}{'No.':<4} {'Type':<8} {'Title':<30} {'Username':<20}{Style.RESET_ALL}")
-    print("-" * 70)
+    # Build the whole table and write it once rather than once per row
+    rows = [
+        f"\n{Fore.CYAN}Available channels and groups for upload:{Style.RESET_ALL}",
+        f"{Fore.CYAN}{'No.':<4} {'Type':<8} {'Title':<30} {'Username':<20}{Style.RESET_ALL}",
+        "-" * 70,
+    ]
+    rows.extend(
+        f"{i:<4} {channel['type']:<8} "
+        f"{channel['title'][:28] + '..' if len(channel['title']) > 30 else channel['title']:<30} "
+        f"{'@' + channel['username'] if channel['username'] else '(Private)':<20}"
+        for i, channel in enumerate(channels, 1)
+    )
     
-    for i, channel in enumerate(channels, 1):
-        username_display = f"@{channel['username']}" if channel['username'] else "(Private)"
-        title_display = channel['title'][:28] + ".." if len(channel['title']) > 30 else channel['title']
-        
-        # Handle Unicode characters safely
-        try:
-            print(f"{i:<4} {channel['type']:<8} {title_display:<30} {username_display:<20}")
-        except UnicodeEncodeError:
-            # Fallback for non-ASCII characters
-            safe_title = title_display.encode('ascii', 'replace').decode('ascii')
-            print(f"{i:<4} {channel['type']:<8} {safe_title:<30} {username_display:<20}")
+    # Handle Unicode characters safely: titles the console can't encode are
+    # written with replacement characters instead of raising
+    reconfigure = getattr(sys.stdout, 'reconfigure', None)
+    if reconfigure:
+        reconfigure(errors='replace')
+    sys.stdout.write('\n'.join(rows) + '\n')
     
     print(f"\n{Fore.CYAN}0. Enter channel manually{Style.RESET_ALL}")
     
     while True:
         try:
-            choice = input(f"\n{Fore.CYAN}Select a channel (0-{len(channels)}): {Style.RESET_ALL}")
+            choice = await ainput(f"\n{Fore.CYAN}Select a channel (0-{len(channels)}): {Style.RESET_ALL}")
             choice_num = int(choice)
             
             if choice_num == 0:
                 # Manual entry
-                channel_username = input(f"{Fore.CYAN}Enter the channel name or username: {Style.RESET_ALL}")
+                channel_username = await ainput(f"{Fore.CYAN}Enter the channel name or username: {Style.RESET_ALL}")
                 try:
                     entity = await client.get_entity(channel_username)
                     print(f"{Fore.GREEN}+ Found: {getattr(entity, 'title', channel_username)}{Style.RESET_ALL}")
@@ -148,64 +195,63 @@ async def display_and_select_upload_target(client):
                     print(f"{Fore.RED}X Cannot access '{channel_username}': {e}{Style.RESET_ALL}")
                     continue
             elif 1 <= choice_num <= len(channels):
-                selected_channel = channels[choice_num - 1]
-                try:
-                    if selected_channel['username']:
-                        entity = await client.get_entity(selected_channel['username'])
-                    else:
-                        entity = await client.get_entity(selected_channel['id'])
-                    print(f"{Fore.GREEN}+ Selected: {getattr(entity, 'title', 'Unknown')}{Style.RESET_ALL}")
-                    return entity
-                except Exception as e:
-                    print(f"{Fore.RED}X Cannot access selected channel: {e}{Style.RESET_ALL}")
-                    continue
+                # The dialog already carries the entity, so no extra RPC is needed
+                entity = channels[choice_num - 1]['entity']
+                print(f"{Fore.GREEN}+ Selected: {getattr(entity, 'title', 'Unknown')}{Style.RESET_ALL}")
+                return entity
             else:
                 print(f"{Fore.RED}Invalid choice! Please select a number between 0 and {len(channels)}.{Style.RESET_ALL}")
         except ValueError:
             print(f"{Fore.RED}Invalid input! Please enter a number.{Style.RESET_ALL}")
-        except KeyboardInterrupt:
-            print(f"\n{Fore.YELLOW}Operation cancelled by user.{Style.RESET_ALL}")
-            return None
 
 
-async def upload_file(client, file_path, channel, progress_bars, uploaded_files, caption=None):
-    """Upload a single file to the channel"""
-    filename = os.path.basename(file_path)
-    progress_bar = None
+def _check_permissions(channel):
+    """Return False if the channel's default rights ban sending media"""
+    rights = getattr(channel, 'default_banned_rights', None)
+    return not (rights and rights.send_media)
+
+
+def make_progress_bar(total, desc):
+    """Create the single byte-counting bar shared by every upload in a run"""
+    return tqdm(
+        total=total,
+        desc=desc,
+        ncols=100,
+        unit="B",
+        unit_scale=True,
+        bar_format=(
+            "{l_bar}%s{bar}%s| {n_fmt}/{total_fmt} {unit} "
+            "| Elapsed: {elapsed}/{remaining} | {rate_fmt}"
+            % (Fore.BLUE, Style.RESET_ALL)
+        ),
+    )
+
+
+async def upload_file(client, file_path, channel, progress_bar, uploaded_files, caption=None, state_log=None,
+                      filename=None, file_size=None):
+    """Upload a single file to the channel
+
+    filename and file_size may be passed in when the caller already knows them
+    (e.g. from the folder walk) to avoid re-parsing the path and another stat.
+    """
+    if filename is None:
+        filename = os.path.basename(file_path)
     
     try:
-        file_size = os.path.getsize(file_path)
+        if file_size is None:
+            file_size = os.path.getsize(file_path)
         
         # Check if already uploaded
         if file_path in uploaded_files:
-            print(f"{Fore.YELLOW}Skipping {filename} - already uploaded{Style.RESET_ALL}")
+            tqdm.write(f"{Fore.YELLOW}Skipping {filename} - already uploaded{Style.RESET_ALL}")
             return True
         
-        # Simple permission check (non-blocking)
-        try:
-            if hasattr(channel, 'default_banned_rights'):
-                rights = channel.default_banned_rights
-                if rights and rights.send_media:
-                    print(f"{Fore.YELLOW}! Warning: May not have media permissions for {getattr(channel, 'title', 'Unknown')}{Style.RESET_ALL}")
-        except Exception:
-            # Ignore permission check errors and proceed with upload
-            pass
+        # Feed this file's progress into the shared bar as deltas
+        sent = [0]
         
-        # Initialize progress bar
-        progress_bar = tqdm(
-            total=file_size,
-            desc=f"Uploading {filename[:20]}...",
-            ncols=100,
-            unit="B",
-            unit_scale=True,
-            leave=True,
-            bar_format=(
-                "{l_bar}%s{bar}%s| {n_fmt}/{total_fmt} {unit} "
-                "| Elapsed: {elapsed}/{remaining} | {rate_fmt}"
-                % (Fore.BLUE, Style.RESET_ALL)
-            ),
-        )
-        progress_bars.append(progress_bar)
+        def progress_callback(current, total, _sent=sent, _update=progress_bar.update):
+            _update(current - _sent[0])
+            _sent[0] = current
         
         # Upload the file
         message = await client.send_file(
@@ -213,81 +259,204 @@ async def upload_file(client, file_path, channel, progress_bars, uploaded_files,
             file_path,
             caption=caption,
             attributes=[DocumentAttributeFilename(filename)],
-            progress_callback=lambda current, total: (
-                progress_bar.update(current - progress_bar.n) if total else None
-            ),
+            progress_callback=progress_callback,
         )
         
         # Verify upload success by checking message
         if not message:
             raise Exception("Upload failed - no message returned")
         
-        # Update progress bar to green when finished
-        progress_bar.bar_format = (
-            "{l_bar}%s{bar}%s| {n_fmt}/{total_fmt} {unit} "
-            "| Elapsed: {elapsed}/{rate_fmt}" % (Fore.GREEN, Style.RESET_ALL)
-        )
-        progress_bar.set_description(f"Uploaded {filename[:20]}...")
-        progress_bar.n = progress_bar.total
-        progress_bar.update(0)
+        # Account for any bytes the callback didn't report
+        if file_size > sent[0]:
+            progress_bar.update(file_size - sent[0])
         
         # Mark as uploaded only after successful upload
         uploaded_files.add(file_path)
-        print(f"{Fore.GREEN}+ Successfully uploaded {filename}{Style.RESET_ALL}")
+        if state_log:
+            state_log.write(file_path + '\n')
+        tqdm.write(f"{Fore.GREEN}+ Successfully uploaded {filename}{Style.RESET_ALL}")
         return True
         
     except Exception as e:
-        if progress_bar:
-            progress_bar.bar_format = (
-                "{l_bar}%s{bar}%s| {n_fmt}/{total_fmt} {unit} "
-                "| Elapsed: {elapsed}/{rate_fmt}" % (Fore.RED, Style.RESET_ALL)
-            )
-            progress_bar.set_description(f"Failed {filename[:20]}...")
-        
-        # Provide specific error information
-        error_msg = str(e)
-        if "peer" in error_msg.lower():
-            print(f"{Fore.RED}X Peer validation failed for {filename}. Channel may be inaccessible.{Style.RESET_ALL}")
-        elif "flood" in error_msg.lower():
-            print(f"{Fore.RED}X Rate limit exceeded. Please wait before uploading more files.{Style.RESET_ALL}")
-        elif "file" in error_msg.lower() and "large" in error_msg.lower():
-            print(f"{Fore.RED}X File {filename} is too large for upload.{Style.RESET_ALL}")
-        elif "permission" in error_msg.lower() or "forbidden" in error_msg.lower():
-            print(f"{Fore.RED}X Permission denied for {filename}. Check channel permissions.{Style.RESET_ALL}")
-        else:
-            print(f"{Fore.RED}X Failed to upload {filename}: {e}{Style.RESET_ALL}")
+        _report_upload_error(filename, e)
         return False
 
 
-async def upload_in_batches(client, files, channel, batch_size, uploaded_files, state_file, caption=None):
-    """Upload files in batches"""
-    tasks = []
-    progress_bars = []
+async def upload_album(client, group, channel, progress_bar, uploaded_files, caption=None, state_log=None):
+    """Upload up to ALBUM_SIZE (path, name, size) entries as one album
+
+    Returns the number of files sent. send_file raises if any part of the
+    album fails, so an album is either sent whole or not at all.
+    """
+    paths = [path for path, _, _ in group]
+    sizes = [size or 0 for _, _, size in group]
+    label = f"album of {len(paths)} files"
+    
+    # Telethon reports album progress in files (e.g. 2.5 of 10), so map that
+    # back onto bytes using the running total of the file sizes
+    offsets = [0]
+    for size in sizes:
+        offsets.append(offsets[-1] + size)
+    sent = [0]
+    
+    def progress_callback(current, total, _sent=sent, _update=progress_bar.update):
+        index = int(current)
+        done = offsets[index] if index >= len(sizes) else offsets[index] + int((current - index) * sizes[index])
+        _update(done - _sent[0])
+        _sent[0] = done
+    
+    try:
+        # One request for the whole group; a list caption labels every item
+        messages = await client.send_file(
+            channel,
+            paths,
+            caption=[caption] * len(paths) if caption else None,
+            progress_callback=progress_callback,
+        )
+        
+        if not messages:
+            raise Exception("Upload failed - no messages returned")
+        
+        if offsets[-1] > sent[0]:
+            progress_bar.update(offsets[-1] - sent[0])
+        
+        for path in paths:
+            uploaded_files.add(path)
+            if state_log:
+                state_log.write(path + '\n')
+        tqdm.write(f"{Fore.GREEN}+ Successfully uploaded {label}{Style.RESET_ALL}")
+        return len(paths)
+    
+    except Exception as e:
+        # Take back the partial progress; the caller retries these files singly
+        progress_bar.update(-sent[0])
+        _report_upload_error(label, e)
+        return 0
+
+
+def _album_ext(name):
+    """Lower-cased extension of name, or '' if it has none"""
+    dot = name.rfind('.')
+    return name[dot:].lower() if dot >= 0 else ''
+
+
+def _report_upload_error(filename, e):
+    """Print a specific message for a failed upload"""
+    error_msg = str(e).lower()
+    if "peer" in error_msg:
+        tqdm.write(f"{Fore.RED}X Peer validation failed for {filename}. Channel may be inaccessible.{Style.RESET_ALL}")
+    elif "flood" in error_msg:
+        tqdm.write(f"{Fore.RED}X Rate limit exceeded. Please wait before uploading more files.{Style.RESET_ALL}")
+    elif "file" in error_msg and "large" in error_msg:
+        tqdm.write(f"{Fore.RED}X File {filename} is too large for upload.{Style.RESET_ALL}")
+    elif "permission" in error_msg or "forbidden" in error_msg:
+        tqdm.write(f"{Fore.RED}X Permission denied for {filename}. Check channel permissions.{Style.RESET_ALL}")
+    else:
+        tqdm.write(f"{Fore.RED}X Failed to upload {filename}: {e}{Style.RESET_ALL}")
+
+
+def _fill_queue(loop, queue, folder_path, file_types, skip, workers, counts, stop):
+    """Walk the folder in a worker thread, feeding new file paths into the queue
+
+    Setting the stop event makes the walk give up promptly, even while it is
+    waiting on a full queue that no worker will drain any more.
+    """
+    def put(item):
+        # Blocks this thread while the queue is full, keeping memory bounded
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return False
+    
+    try:
+        for item in _iter_files(folder_path, file_types, skip, counts):
+            if stop.is_set() or not put(item):
+                return
+    finally:
+        # Workers that have stopped don't need END markers
+        if not stop.is_set():
+            for _ in range(workers):
+                if not put(_END_OF_FILES):
+                    break
+
+
+async def upload_in_batches(client, queue, channel, batch_size, uploaded_files, state_log, caption=None, album=False):
+    """Upload files from the queue with batch_size workers
+
+    With album set, each worker sends up to ALBUM_SIZE ALBUM_EXTS files per
+    request; other files, and albums Telegram rejects, go one at a time.
+    """
+    # One aggregate bar for the run; the folder is still being scanned, so
+    # its total grows as workers pick up files
+    progress_bar = make_progress_bar(0, "Uploading")
     successful_uploads = 0
     failed_uploads = 0
+    group_size = ALBUM_SIZE if album else 1
     
-    for i, file_path in enumerate(files, 1):
-        tasks.append(upload_file(client, file_path, channel, progress_bars, uploaded_files, caption))
+    async def _send(group):
+        """Upload a group as one album, or file by file if that isn't possible"""
+        nonlocal successful_uploads, failed_uploads
+        progress_bar.total += sum(size or 0 for _, _, size in group)
+        progress_bar.refresh()
+        
+        if len(group) > 1:
+            try:
+                sent = await upload_album(client, group, channel, progress_bar, uploaded_files, caption, state_log)
+            except Exception:
+                sent = 0
+            if sent:
+                successful_uploads += sent
+                return
+            # Albums are all-or-nothing, so nothing from this one was posted
+            tqdm.write(f"{Fore.YELLOW}! Retrying the album's files one at a time{Style.RESET_ALL}")
         
-        # Run in batches
-        if len(tasks) == batch_size or i == len(files):
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+        for file_path, filename, file_size in group:
+            try:
+                result = await upload_file(client, file_path, channel, progress_bar, uploaded_files, caption,
+                                           state_log, filename=filename, file_size=file_size)
+            except Exception:
+                result = False
             
             # Count successful and failed uploads
-            for result in results:
-                if isinstance(result, Exception):
-                    failed_uploads += 1
-                elif result is True:
-                    successful_uploads += 1
-                else:
-                    failed_uploads += 1
-            
-            # Save state after each batch
-            save_upload_state(uploaded_files, state_file)
-            tasks.clear()
+            if result is True:
+                successful_uploads += 1
+            else:
+                failed_uploads += 1
+    
+    async def _worker():
+        done = False
+        while not done:
+            group = []
+            while len(group) < group_size:
+                item = await queue.get()
+                if item is _END_OF_FILES:
+                    done = True
+                    break
+                if album and _album_ext(item[1]) not in ALBUM_EXTS:
+                    await _send([item])
+                    continue
+                group.append(item)
+            if group:
+                await _send(group)
+    
+    try:
+        # Workers catch their own upload errors, so the group only tears
+        # down the rest on cancellation (e.g. Ctrl-C)
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(batch_size):
+                tg.create_task(_worker())
+    finally:
+        progress_bar.close()
     
     # Provide detailed completion summary
-    total_files = len(files)
+    total_files = successful_uploads + failed_uploads
+    if not total_files:
+        return successful_uploads, failed_uploads
     if successful_uploads == total_files:
         print(f"\n{Fore.GREEN}+ Upload completed successfully! {successful_uploads}/{total_files} files uploaded{Style.RESET_ALL}")
     elif successful_uploads > 0:
@@ -298,147 +467,175 @@ async def upload_in_batches(client, files, channel, batch_size, uploaded_files,
     return successful_uploads, failed_uploads
 
 
-async def main():
+async def upload_with_client(client):
+    """Pick a target and upload files using an already-connected client"""
+    # Select upload target
+    channel = await display_and_select_upload_target(client)
+    if not channel:
+        print(f"{Fore.RED}No channel selected. Exiting...{Style.RESET_ALL}")
+        return
+    
+    print(f"{Fore.YELLOW}Selected upload target: {channel.title} (ID: {channel.id}){Style.RESET_ALL}")
+    
+    # Simple permission check (non-blocking), done once rather than per file
+    if not _check_permissions(channel):
+        print(f"{Fore.YELLOW}! Warning: May not have media permissions for {getattr(channel, 'title', 'Unknown')}{Style.RESET_ALL}")
+    
+    # Choose upload mode
+    print(
+        f"{Fore.CYAN}Choose upload mode:{Style.RESET_ALL}\n"
+        f"1. Upload single file\n"
+        f"2. Upload entire folder\n"
+    )
+    mode_choice = (await ainput(f"{Fore.CYAN}Enter your choice (1-2): {Style.RESET_ALL}")).strip()
+    
+    if mode_choice == "1":
+        # Single file upload
+        file_path = (await ainput(f"{Fore.CYAN}Enter the file path to upload: {Style.RESET_ALL}")).strip()
+        
+        # One stat answers exists, isfile and the size
+        file_stat = _regular_stat(file_path) if file_path else None
+        if file_stat is None:
+            print(f"{Fore.RED}Invalid file path! Exiting...{Style.RESET_ALL}")
+            return
+        
+        # Optional caption for single file
+        add_caption = (await ainput(f"{Fore.CYAN}Add a caption to the file? (y/n): {Style.RESET_ALL}")).lower()
+        caption = None
+        if add_caption == 'y':
+            caption = await ainput(f"{Fore.CYAN}Enter caption: {Style.RESET_ALL}")
+        
+        # Confirm upload
+        filename = os.path.basename(file_path)
+        confirm = await ainput(f"{Fore.YELLOW}Upload '{filename}' to {channel.title}? (y/n): {Style.RESET_ALL}")
+        if confirm.lower() != 'y':
+            print(f"{Fore.YELLOW}Upload cancelled.{Style.RESET_ALL}")
+            return
+        
+        # Upload single file
+        print(f"{Fore.GREEN}Starting upload...{Style.RESET_ALL}")
+        uploaded_files = set()
+        file_size = file_stat.st_size
+        progress_bar = make_progress_bar(file_size, f"Uploading {filename[:20]}...")
+        try:
+            result = await upload_file(client, file_path, channel, progress_bar, uploaded_files, caption,
+                                       filename=filename, file_size=file_size)
+        finally:
+            progress_bar.close()
+        
+        if result:
+            print(f"\n{Fore.GREEN}+ Upload completed successfully! '{filename}' uploaded to {channel.title}{Style.RESET_ALL}")
+        else:
+            print(f"\n{Fore.RED}X Upload failed! '{filename}' could not be uploaded to {channel.title}{Style.RESET_ALL}")
+    
+    elif mode_choice == "2":
+        # Folder upload (existing functionality)
+        folder_path = (await ainput(f"{Fore.CYAN}Enter the folder path to upload from: {Style.RESET_ALL}")).strip()
+        
+        if not folder_path or not os.path.exists(folder_path):
+            print(f"{Fore.RED}Invalid folder path! Exiting...{Style.RESET_ALL}")
+            return
+        
+        # Choose file types
+        print(
+            f"{Fore.CYAN}Choose the type of files to upload:{Style.RESET_ALL}\n"
+            f"1. Images (.jpg, .jpeg, .png, .gif, .webp)\n"
+            f"2. Videos (.mp4, .avi, .mov, .mkv, .webm)\n"
+            f"3. Documents (.pdf, .doc, .docx, .txt)\n"
+            f"4. Archives (.zip, .rar, .7z)\n"
+            f"5. All files\n"
+        )
+        choice = await ainput(f"{Fore.CYAN}Enter your choice (1-5): {Style.RESET_ALL}")
+        
+        file_types = None
+        if choice == "1":
+            file_types = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
+        elif choice == "2":
+            file_types = ['.mp4', '.avi', '.mov', '.mkv', '.webm']
+        elif choice == "3":
+            file_types = ['.pdf', '.doc', '.docx', '.txt']
+        elif choice == "4":
+            file_types = ['.zip', '.rar', '.7z']
+        elif choice == "5":
+            file_types = None  # All files
+        else:
+            print(f"{Fore.RED}Invalid choice! Exiting...{Style.RESET_ALL}")
+            return
+        
+        # Load upload state
+        state_file = os.path.join(folder_path, "upload_state.json")
+        uploaded_files = load_upload_state(state_file)
+        if uploaded_files:
+            print(f"{Fore.YELLOW}{len(uploaded_files)} files already uploaded from this folder (will be skipped){Style.RESET_ALL}")
+        
+        # Optional caption
+        add_caption = (await ainput(f"{Fore.CYAN}Add a caption to all files? (y/n): {Style.RESET_ALL}")).lower()
+        caption = None
+        if add_caption == 'y':
+            caption = await ainput(f"{Fore.CYAN}Enter caption: {Style.RESET_ALL}")
+        
+        # Confirm upload
+        confirm = await ainput(f"{Fore.YELLOW}Upload new files from '{folder_path}' to {channel.title}? (y/n): {Style.RESET_ALL}")
+        if confirm.lower() != 'y':
+            print(f"{Fore.YELLOW}Upload cancelled.{Style.RESET_ALL}")
+            return
+        
+        # Start upload while the folder is still being scanned
+        print(f"{Fore.GREEN}Starting upload...{Style.RESET_ALL}")
+        queue = asyncio.Queue(maxsize=batch_size * 4)
+        counts = {'found': 0, 'skipped': 0}
+        stop_walk = threading.Event()
+        producer = asyncio.create_task(asyncio.to_thread(
+            _fill_queue, asyncio.get_running_loop(), queue, folder_path,
+            frozenset(file_types) if file_types else None,
+            frozenset(uploaded_files), batch_size, counts, stop_walk,
+        ))
+        # Each completed upload is appended to the log as it finishes
+        with open(upload_log_path(state_file), 'a', buffering=1, encoding='utf-8') as state_log:
+            try:
+                # Images and videos go out as albums, one request per ALBUM_SIZE files
+                successful, failed = await upload_in_batches(client, queue, channel, batch_size, uploaded_files,
+                                                             state_log, caption, album=choice in ("1", "2"))
+                await producer
+            finally:
+                # Stop and join the walker so a cancelled run can't leave it
+                # blocked on a full queue, holding up interpreter shutdown
+                stop_walk.set()
+                if not producer.done():
+                    await asyncio.wait([producer])
+                # Compact off the event loop; the log already holds every upload,
+                # so nothing is lost if this is interrupted
+                await asyncio.to_thread(compact_upload_state, set(uploaded_files), state_file)
+        
+        print(f"Found {counts['found']} total files.")
+        if counts['skipped'] > 0:
+            print(f"{Fore.YELLOW}{counts['skipped']} files already uploaded (skipped){Style.RESET_ALL}")
+        if not counts['found']:
+            print(f"{Fore.RED}No files found to upload!{Style.RESET_ALL}")
+        elif not successful + failed:
+            print(f"{Fore.YELLOW}All files have already been uploaded!{Style.RESET_ALL}")
+    
+    else:
+        print(f"{Fore.RED}Invalid choice! Exiting...{Style.RESET_ALL}")
+        return
+
+
+async def main(client=None):
+    """Run the uploader, reusing client when one is passed in"""
     print(f"{Fore.CYAN}>> TELEGRAM FILE UPLOADER{Style.RESET_ALL}")
     print(f"{Fore.CYAN}{'='*40}{Style.RESET_ALL}")
     
     try:
-        async with TelegramClient(session_name, api_id, api_hash) as client:
+        if client is not None:
+            # The caller owns this connection and keeps it open afterwards
+            client.flood_sleep_threshold = FLOOD_SLEEP_THRESHOLD
+            await upload_with_client(client)
+            return
+        
+        async with TelegramClient(session_name, api_id, api_hash, flood_sleep_threshold=FLOOD_SLEEP_THRESHOLD) as client:
             print(f"{Fore.GREEN}+ Connected to Telegram successfully!{Style.RESET_ALL}")
-            
-            # Select upload target
-            channel = await display_and_select_upload_target(client)
-            if not channel:
-                print(f"{Fore.RED}No channel selected. Exiting...{Style.RESET_ALL}")
-                return
-            
-            print(f"{Fore.YELLOW}Selected upload target: {channel.title} (ID: {channel.id}){Style.RESET_ALL}")
-            
-            # Choose upload mode
-            print(
-                f"{Fore.CYAN}Choose upload mode:{Style.RESET_ALL}\n"
-                f"1. Upload single file\n"
-                f"2. Upload entire folder\n"
-            )
-            mode_choice = input(f"{Fore.CYAN}Enter your choice (1-2): {Style.RESET_ALL}").strip()
-            
-            if mode_choice == "1":
-                # Single file upload
-                file_path = input(f"{Fore.CYAN}Enter the file path to upload: {Style.RESET_ALL}").strip()
-                
-                if not file_path or not os.path.exists(file_path) or not os.path.isfile(file_path):
-                    print(f"{Fore.RED}Invalid file path! Exiting...{Style.RESET_ALL}")
-                    return
-                
-                # Optional caption for single file
-                add_caption = input(f"{Fore.CYAN}Add a caption to the file? (y/n): {Style.RESET_ALL}").lower()
-                caption = None
-                if add_caption == 'y':
-                    caption = input(f"{Fore.CYAN}Enter caption: {Style.RESET_ALL}")
-                
-                # Confirm upload
-                filename = os.path.basename(file_path)
-                confirm = input(f"{Fore.YELLOW}Upload '{filename}' to {channel.title}? (y/n): {Style.RESET_ALL}")
-                if confirm.lower() != 'y':
-                    print(f"{Fore.YELLOW}Upload cancelled.{Style.RESET_ALL}")
-                    return
-                
-                # Upload single file
-                print(f"{Fore.GREEN}Starting upload...{Style.RESET_ALL}")
-                progress_bars = []
-                uploaded_files = set()
-                result = await upload_file(client, file_path, channel, progress_bars, uploaded_files, caption)
-                
-                # Close progress bars
-                for pb in progress_bars:
-                    pb.close()
-                
-                if result:
-                    print(f"\n{Fore.GREEN}+ Upload completed successfully! '{filename}' uploaded to {channel.title}{Style.RESET_ALL}")
-                else:
-                    print(f"\n{Fore.RED}X Upload failed! '{filename}' could not be uploaded to {channel.title}{Style.RESET_ALL}")
-            
-            elif mode_choice == "2":
-                # Folder upload (existing functionality)
-                folder_path = input(f"{Fore.CYAN}Enter the folder path to upload from: {Style.RESET_ALL}").strip()
-                
-                if not folder_path or not os.path.exists(folder_path):
-                    print(f"{Fore.RED}Invalid folder path! Exiting...{Style.RESET_ALL}")
-                    return
-                
-                # Choose file types
-                print(
-                    f"{Fore.CYAN}Choose the type of files to upload:{Style.RESET_ALL}\n"
-                    f"1. Images (.jpg, .jpeg, .png, .gif, .webp)\n"
-                    f"2. Videos (.mp4, .avi, .mov, .mkv, .webm)\n"
-                    f"3. Documents (.pdf, .doc, .docx, .txt)\n"
-                    f"4. Archives (.zip, .rar, .7z)\n"
-                    f"5. All files\n"
-                )
-                choice = input(f"{Fore.CYAN}Enter your choice (1-5): {Style.RESET_ALL}")
-                
-                file_types = None
-                if choice == "1":
-                    file_types = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
-                elif choice == "2":
-                    file_types = ['.mp4', '.avi', '.mov', '.mkv', '.webm']
-                elif choice == "3":
-                    file_types = ['.pdf', '.doc', '.docx', '.txt']
-                elif choice == "4":
-                    file_types = ['.zip', '.rar', '.7z']
-                elif choice == "5":
-                    file_types = None  # All files
-                else:
-                    print(f"{Fore.RED}Invalid choice! Exiting...{Style.RESET_ALL}")
-                    return
-                
-                # Get files to upload
-                files = get_files_from_folder(folder_path, file_types)
-                
-                if not files:
-                    print(f"{Fore.RED}No files found to upload!{Style.RESET_ALL}")
-                    return
-                
-                # Load upload state
-                state_file = os.path.join(folder_path, "upload_state.json")
-                uploaded_files = load_upload_state(state_file)
-                
-                # Filter out already uploaded files
-                original_count = len(files)
-                files = [f for f in files if f not in uploaded_files]
-                already_uploaded = original_count - len(files)
-                
-                print(f"Found {original_count} total files.")
-                if already_uploaded > 0:
-                    print(f"{Fore.YELLOW}{already_uploaded} files already uploaded (skipping){Style.RESET_ALL}")
-                print(f"{Fore.GREEN}{len(files)} new files to upload{Style.RESET_ALL}")
-                
-                if not files:
-                    print(f"{Fore.YELLOW}All files have already been uploaded!{Style.RESET_ALL}")
-                    return
-                
-                # Optional caption
-                add_caption = input(f"{Fore.CYAN}Add a caption to all files? (y/n): {Style.RESET_ALL}").lower()
-                caption = None
-                if add_caption == 'y':
-                    caption = input(f"{Fore.CYAN}Enter caption: {Style.RESET_ALL}")
-                
-                # Confirm upload
-                confirm = input(f"{Fore.YELLOW}Upload {len(files)} files to {channel.title}? (y/n): {Style.RESET_ALL}")
-                if confirm.lower() != 'y':
-                    print(f"{Fore.YELLOW}Upload cancelled.{Style.RESET_ALL}")
-                    return
-                
-                # Start upload
-                print(f"{Fore.GREEN}Starting upload...{Style.RESET_ALL}")
-                successful, failed = await upload_in_batches(client, files, channel, batch_size, uploaded_files, state_file, caption)
-                
-                # Final summary is already printed by upload_in_batches function
-            
-            else:
-                print(f"{Fore.RED}Invalid choice! Exiting...{Style.RESET_ALL}")
-                return
-                
+            await upload_with_client(client)
+
     except KeyboardInterrupt:
         print(f"\n{Fore.YELLOW}! Operation cancelled by user{Style.RESET_ALL}")
     except Exception as e:
@@ -447,4 +644,15 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop is optional and unavailable on Windows
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        # Ctrl-C during an awaited prompt cancels main() rather than raising inside it
+        print(f"\n{Fore.YELLOW}! Operation cancelled by user{Style.RESET_ALL}")
\ No newline at end of file
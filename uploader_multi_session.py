@@ -4,75 +4,209 @@ Telegram Multi-Session Uploader
 Upload files to Telegram with support for multiple accounts
 """
 
+import argparse
 import asyncio
+import itertools
 import os
 import json
+import random
+import re
+import time
+from collections import namedtuple
 from pathlib import Path
 from colorama import Fore, Style, init
 from tqdm.asyncio import tqdm
-from telethon import TelegramClient
+from telethon import TelegramClient, utils
+from telethon.errors import FloodWaitError
+from telethon.helpers import generate_random_long
+from telethon.tl.functions.upload import SaveBigFilePartRequest, SaveFilePartRequest
 from telethon.tl.types import (
     Channel,
     Chat,
     DocumentAttributeFilename,
+    InputFile,
+    InputFileBig,
 )
 
-# Import our session manager
+try:
+    from telethon.errors import FloodPremiumWaitError
+except ImportError:
+    # Older Telethon releases report every flood wait as FloodWaitError
+    FloodPremiumWaitError = FloodWaitError
+
+# Import our session manager and the shared upload state helpers
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from session_manager import SessionManager, SessionInfo
+from upload_state import STATE_SUFFIXES, compact_upload_state, load_upload_state, upload_log_path
 
 # Initialize colorama
 init(autoreset=True)
 
+# Completed uploads are written to the state log in groups of this many
+LOG_FLUSH_EVERY = 32
 
-def save_upload_state(uploaded_files, state_file="upload_state.json"):
-    """Save uploaded file paths to JSON file"""
-    try:
-        with open(state_file, 'w') as f:
-            json.dump(list(uploaded_files), f)
-    except Exception as e:
-        print(f"{Fore.YELLOW}Warning: Could not save upload state: {e}{Style.RESET_ALL}")
+# Above this size Telegram requires the "big file" part requests and
+# counts the upload against its large-file queue; such files also push
+# their parts over several concurrent requests
+BIG_FILE_SIZE = 10 * 1024 * 1024
+FAST_UPLOAD_WORKERS = 4
+# Telegram's largest allowed part size
+UPLOAD_PART_SIZE = 512 * 1024
 
+# Telegram runs separate queues for small and large uploads and starts
+# answering with FLOOD_WAIT beyond about ten parallel operations
+MAX_CONCURRENCY = 10
+DEFAULT_CONCURRENCY = 4
+DEFAULT_LARGE_CONCURRENCY = 2
 
-def load_upload_state(state_file="upload_state.json"):
-    """Load uploaded file paths from JSON file"""
-    try:
-        with open(state_file, 'r') as f:
-            return set(json.load(f))
-    except FileNotFoundError:
-        return set()
-    except Exception as e:
-        print(f"{Fore.YELLOW}Warning: Could not load upload state: {e}{Style.RESET_ALL}")
-        return set()
+# Telegram caps an album at ten media items
+ALBUM_SIZE = 10
+# Only these go into albums; Telethon sends .gif/.webp as documents, which
+# Telegram refuses to mix with photos
+ALBUM_EXTS = frozenset(('.jpg', '.jpeg', '.png'))
+
+# Minimum seconds between progress bar repaints during an upload
+PROGRESS_REFRESH_INTERVAL = 0.25
+
+# Dialog entity types that can be uploaded to
+CHANNEL_TYPES = frozenset((Channel, Chat))
+
+# Channel lists are cached per session so repeated runs skip get_dialogs
+DIALOG_CACHE_DIR = Path.home() / ".cache" / "tgdus"
+DIALOG_CACHE_TTL = 600  # seconds
+
+# Known upload failures, matched in one pass over the error text
+_ERR_RE = re.compile(
+    r'(?P<peer>peer validation failed|invalid peer)'
+    r'|(?P<flood>flood)'
+    r'|(?P<large>file.*large|large.*file)'
+    r'|(?P<permission>permission|forbidden)',
+    re.IGNORECASE | re.DOTALL,
+)
+_ERR_MSGS = {
+    'peer': "X Peer validation failed for {filename}. Channel may be inaccessible.",
+    'flood': "X Rate limit exceeded. Please wait before uploading more files.",
+    'large': "X File {filename} is too large for upload.",
+    'permission': "X Permission denied for {filename}. Check channel permissions.",
+}
+
+# Times an upload is retried after sitting out a flood wait
+FLOOD_RETRIES = 3
+
+# Colors bound once for the upload-path log() calls
+_RED, _GREEN, _YEL, _RST = Fore.RED, Fore.GREEN, Fore.YELLOW, Style.RESET_ALL
+
+
+def log(color, msg):
+    """Print a colored line above any active progress bars"""
+    tqdm.write(f"{color}{msg}{_RST}")
 
 
-def get_files_from_folder(folder_path, file_types=None):
-    """Get all files from folder based on file types"""
-    files = []
+def append_uploaded(log_file, paths):
+    """Append paths to the upload log in a single write"""
+    with open(log_file, 'a', encoding='utf-8') as f:
+        f.write(''.join(path + '\n' for path in paths))
+
+
+class UploadLog:
+    """Collects uploaded paths and appends them to the log flush_every at a time
+
+    A crash loses at most the unflushed tail, and those files are only
+    re-sent on the next run.
+    """
     
-    if not os.path.exists(folder_path):
-        print(f"{Fore.RED}Folder does not exist: {folder_path}{Style.RESET_ALL}")
-        return files
+    def __init__(self, log_file, flush_every=LOG_FLUSH_EVERY):
+        self.log_file = log_file
+        self.flush_every = flush_every
+        self._pending = []
+        self._lock = asyncio.Lock()
     
-    for root, dirs, filenames in os.walk(folder_path):
-        for filename in filenames:
-            file_path = os.path.join(root, filename)
-            
-            # Skip state files
-            if filename.endswith('_state.json'):
-                continue
+    async def add(self, path):
+        self._pending.append(path)
+        if len(self._pending) >= self.flush_every:
+            await self.flush()
+    
+    async def flush(self):
+        # The lock keeps overlapping flushes writing in order
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(append_uploaded, self.log_file, batch)
+            except Exception as e:
+                log(_YEL, f"Warning: Could not write upload log: {e}")
+
+
+# A file found by the folder walk; size is None if it couldn't be read
+FileRec = namedtuple('FileRec', 'path name size')
+
+
+def iter_files(folder_path, file_types=None, skip=frozenset(), counts=None):
+    """Yield a FileRec for each matching file under folder_path, walking with os.scandir
+
+    Paths in skip are counted but not yielded; when counts is given its
+    'found' and 'skipped' entries are incremented as the walk goes.
+    """
+    try:
+        entries = os.scandir(folder_path)
+    except OSError:
+        # Unreadable directories are skipped, as os.walk does
+        return
+    
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_files(entry.path, file_types, skip, counts)
+            elif entry.is_file():
+                name = entry.name
                 
-            # Filter by file types if specified
-            if file_types:
-                file_ext = os.path.splitext(filename)[1].lower()
-                if file_ext not in file_types:
+                # Skip state files
+                if name.endswith(STATE_SUFFIXES):
                     continue
-            
-            files.append(file_path)
+                
+                # Filter by file types if specified
+                if file_types and os.path.splitext(name)[1].lower() not in file_types:
+                    continue
+                
+                path = entry.path
+                if counts is not None:
+                    counts['found'] += 1
+                if path in skip:
+                    if counts is not None:
+                        counts['skipped'] += 1
+                    continue
+                
+                # The scandir entry's stat is usually already cached
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    # Let upload_file report the error for this file
+                    size = None
+                yield FileRec(path, name, size)
+
+
+def get_files_from_folder(folder_path, file_types=None, skip=frozenset(), counts=None):
+    """Get a FileRec for every matching file in the folder, leaving out paths in skip"""
+    if not os.path.exists(folder_path):
+        print(f"{Fore.RED}Folder does not exist: {folder_path}{Style.RESET_ALL}")
+        return []
     
-    return files
+    if file_types:
+        file_types = frozenset(file_types)
+    return list(iter_files(folder_path, file_types, skip, counts))
+
+
+def _can_send(entity):
+    """True if the user may post media to entity (or administers it)"""
+    rights = getattr(entity, 'default_banned_rights', None)
+    return (
+        not (rights and rights.send_media)
+        or getattr(entity, 'creator', False)
+        or getattr(entity, 'admin_rights', None) is not None
+    )
 
 
 async def list_user_channels(client):
@@ -80,38 +214,62 @@ async def list_user_channels(client):
     print(f"{Fore.YELLOW}Fetching your channels and groups...{Style.RESET_ALL}")
     
     dialogs = await client.get_dialogs()
-    channels = []
     
-    for dialog in dialogs:
-        entity = dialog.entity
-        if isinstance(entity, (Channel, Chat)):
-            # Check if user has admin rights or can send messages
-            try:
-                permissions = dialog.entity.default_banned_rights
-                can_send = not (permissions and permissions.send_media)
-                
-                if can_send or hasattr(entity, 'creator') or hasattr(entity, 'admin_rights'):
-                    channels.append({
-                        'title': entity.title,
-                        'username': entity.username if hasattr(entity, 'username') else None,
-                        'id': entity.id,
-                        'type': 'Channel' if isinstance(entity, Channel) else 'Group'
-                    })
-            except:
-                # If we can't check permissions, include it anyway
-                channels.append({
-                    'title': entity.title,
-                    'username': entity.username if hasattr(entity, 'username') else None,
-                    'id': entity.id,
-                    'type': 'Channel' if isinstance(entity, Channel) else 'Group'
-                })
-    
-    return channels
-
-
-async def display_and_select_upload_target(client):
-    """Display available channels and let user select one for upload"""
-    channels = await list_user_channels(client)
+    # One pass that reads each dialog's entity once
+    return [
+        {
+            'title': entity.title,
+            'username': getattr(entity, 'username', None),
+            'id': entity.id,
+            'peer_id': utils.get_peer_id(entity),
+            'type': 'Channel' if entity_type is Channel else 'Group',
+        }
+        for dialog in dialogs
+        for entity in (dialog.entity,)
+        for entity_type in (type(entity),)
+        if entity_type in CHANNEL_TYPES and _can_send(entity)
+    ]
+
+
+def _dialog_cache_path(session_name):
+    return DIALOG_CACHE_DIR / f"dialogs_{session_name}.json"
+
+
+def load_cached_channels(session_name, ttl=DIALOG_CACHE_TTL):
+    """Return the cached channel list for a session, or None if missing or older than ttl"""
+    path = _dialog_cache_path(session_name)
+    try:
+        if time.time() - path.stat().st_mtime < ttl:
+            return json.loads(path.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"{Fore.YELLOW}Warning: Could not read channel cache: {e}{Style.RESET_ALL}")
+    return None
+
+
+def save_cached_channels(session_name, channels):
+    """Write a session's channel list to the dialog cache"""
+    try:
+        DIALOG_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _dialog_cache_path(session_name).write_text(json.dumps(channels), encoding='utf-8')
+    except Exception as e:
+        print(f"{Fore.YELLOW}Warning: Could not write channel cache: {e}{Style.RESET_ALL}")
+
+
+async def display_and_select_upload_target(client, session_name=None):
+    """Display available channels and let user select one for upload
+
+    With a session_name, a channel list fetched in the last DIALOG_CACHE_TTL
+    seconds is reused instead of downloading the dialogs again.
+    """
+    channels = load_cached_channels(session_name) if session_name else None
+    if channels:
+        print(f"{Fore.YELLOW}Using cached channel list (refreshed every {DIALOG_CACHE_TTL // 60} minutes){Style.RESET_ALL}")
+    else:
+        channels = await list_user_channels(client)
+        if session_name and channels:
+            save_cached_channels(session_name, channels)
     
     if not channels:
         print(f"{Fore.RED}No channels or groups found where you can upload!{Style.RESET_ALL}")
@@ -156,8 +314,11 @@ async def display_and_select_upload_target(client):
                     if selected_channel['username']:
                         entity = await client.get_entity(selected_channel['username'])
                     else:
-                        entity = await client.get_entity(selected_channel['id'])
+                        # The marked peer ID resolves from the session's entity cache
+                        entity = await client.get_entity(selected_channel.get('peer_id', selected_channel['id']))
                     print(f"{Fore.GREEN}+ Selected: {getattr(entity, 'title', 'Unknown')}{Style.RESET_ALL}")
+                    # list_user_channels already checked this channel's rights
+                    entity._tgdus_validated = True
                     return entity
                 except Exception as e:
                     print(f"{Fore.RED}X Cannot access selected channel: {e}{Style.RESET_ALL}")
@@ -171,121 +332,342 @@ async def display_and_select_upload_target(client):
             return None
 
 
-async def upload_file(client, file_path, channel, progress_bars, uploaded_files, caption=None):
-    """Upload a single file to the channel"""
-    filename = os.path.basename(file_path)
-    progress_bar = None
+def _read_part(f, part_index):
+    """Read one UPLOAD_PART_SIZE part from an open binary file"""
+    f.seek(part_index * UPLOAD_PART_SIZE)
+    return f.read(UPLOAD_PART_SIZE)
+
+
+async def fast_upload(client, file_path, file_size, n_tasks=FAST_UPLOAD_WORKERS, progress_callback=None):
+    """Upload a file's parts with n_tasks requests in flight and return the InputFile
+
+    Telethon's own upload waits for each part before sending the next one;
+    keeping several SaveFilePart requests outstanding on the connection
+    hides that round-trip latency.
+    """
+    file_id = generate_random_long()
+    part_count = (file_size + UPLOAD_PART_SIZE - 1) // UPLOAD_PART_SIZE
+    is_big = file_size > BIG_FILE_SIZE
+    parts = iter(range(part_count))
+    uploaded = 0
+    
+    async def _worker():
+        nonlocal uploaded
+        with open(file_path, 'rb') as f:
+            # Workers share the part iterator, so each part is sent exactly once
+            for part_index in parts:
+                # Read on a worker thread so a slow disk doesn't stall the sockets
+                data = await asyncio.to_thread(_read_part, f, part_index)
+                if is_big:
+                    request = SaveBigFilePartRequest(file_id, part_index, part_count, data)
+                else:
+                    request = SaveFilePartRequest(file_id, part_index, data)
+                if not await client(request):
+                    raise Exception(f"Failed to upload file part {part_index}")
+                
+                uploaded += len(data)
+                if progress_callback:
+                    progress_callback(uploaded, file_size)
     
     try:
-        file_size = os.path.getsize(file_path)
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(min(n_tasks, part_count)):
+                tg.create_task(_worker())
+    except ExceptionGroup as eg:
+        # The group cancels the other workers on the first failure; raise
+        # that failure itself so flood waits are retried by with_flood_retry
+        # and _report_upload_error sees the real reason
+        raise eg.exceptions[0]
+    
+    name = os.path.basename(file_path)
+    if is_big:
+        return InputFileBig(file_id, part_count, name)
+    return InputFile(file_id, part_count, name, md5_checksum='')
+
+
+class FloodGate:
+    """Holds every upload of a run back while any of them sits out a flood wait
+
+    Made per run, so its Event belongs to the loop that is uploading. The
+    gate only reopens once the last pending wait ends, whether it finished
+    or was cancelled.
+    """
+    
+    def __init__(self):
+        self._open = asyncio.Event()
+        self._open.set()
+        self._waiting = 0
+    
+    async def wait(self):
+        await self._open.wait()
+    
+    async def sleep(self, seconds):
+        self._waiting += 1
+        self._open.clear()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._waiting -= 1
+            if not self._waiting:
+                self._open.set()
+
+
+async def with_flood_retry(send, gate=None):
+    """Await send(), sitting out flood waits and retrying up to FLOOD_RETRIES times
+
+    While one upload waits, gate holds every other upload sharing it back too.
+    """
+    if gate is None:
+        gate = FloodGate()
+    
+    for attempt in range(FLOOD_RETRIES + 1):
+        await gate.wait()
+        try:
+            return await send()
+        except (FloodWaitError, FloodPremiumWaitError) as e:
+            if attempt == FLOOD_RETRIES:
+                raise
+            # Jitter keeps paused uploads from all retrying at the same instant
+            wait = e.seconds + random.uniform(1, 5)
+            log(_YEL, f"! Flood wait: pausing uploads for {wait:.0f}s (retry {attempt + 1}/{FLOOD_RETRIES})")
+            await gate.sleep(wait)
+
+
+def make_progress_bar(position=0):
+    """Create a reusable upload bar pinned to a terminal row"""
+    return tqdm(
+        total=0,
+        position=position,
+        leave=False,
+        ncols=100,
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        colour="green"
+    )
+
+
+async def upload_file(client, rec, peer, progress_bar, uploaded_files, caption=None, state_log=None,
+                      flood_gate=None):
+    """Upload the FileRec rec to the channel's input peer, reporting on progress_bar
+
+    client is always the caller's pooled connection; uploads never open their own.
+    """
+    file_path, filename, file_size = rec
+    
+    try:
+        if file_size is None:
+            file_size = await asyncio.to_thread(os.path.getsize, file_path)
         
         # Check if already uploaded
         if file_path in uploaded_files:
-            print(f"{Fore.YELLOW}Skipping {filename} - already uploaded{Style.RESET_ALL}")
+            log(_YEL, f"Skipping {filename} - already uploaded")
             return True
         
-        # Simple permission check (non-blocking)
-        try:
-            if hasattr(channel, 'default_banned_rights'):
-                rights = channel.default_banned_rights
-                if rights and rights.send_media:
-                    print(f"{Fore.YELLOW}! Warning: May not have media permissions for {getattr(channel, 'title', 'Unknown')}{Style.RESET_ALL}")
-        except Exception:
-            # Ignore permission check errors and proceed with upload
-            pass
-        
-        # Initialize progress bar
-        progress_bar = tqdm(
-            total=file_size,
-            desc=f"Uploading {filename[:20]}...",
-            ncols=100,
-            unit="B",
-            unit_scale=True,
-            unit_divisor=1024,
-            colour="green"
-        )
-        progress_bars.append(progress_bar)
+        # Point the bar at this file
+        progress_bar.reset(total=file_size)
+        progress_bar.set_description(f"Uploading {filename[:20]}...")
+        
+        # Upload file with progress callback, repainting at most every
+        # PROGRESS_REFRESH_INTERVAL seconds (and always on the last part)
+        last_refresh = [0.0]
         
-        # Upload file with progress callback
         def progress_callback(current, total):
-            if progress_bar:
-                progress_bar.n = current
+            progress_bar.n = current
+            now = time.monotonic()
+            if now - last_refresh[0] >= PROGRESS_REFRESH_INTERVAL or current >= total:
                 progress_bar.refresh()
+                last_refresh[0] = now
         
-        # Perform upload using the channel entity directly
-        await client.send_file(
-            channel,  # Use entity directly, not channel.id
-            file_path,
-            caption=caption,
-            progress_callback=progress_callback,
-            attributes=[DocumentAttributeFilename(filename)]
-        )
+        async def _send():
+            # Large files have their parts pushed in parallel first; send_file
+            # then only attaches the already-uploaded handle
+            file = file_path
+            if file_size > BIG_FILE_SIZE:
+                file = await fast_upload(client, file_path, file_size, progress_callback=progress_callback)
+            
+            # Upload straight to the pre-resolved peer, skipping entity lookups
+            await client.send_file(
+                peer,
+                file,
+                caption=caption,
+                progress_callback=progress_callback,
+                attributes=[DocumentAttributeFilename(filename)]
+            )
+        
+        await with_flood_retry(_send, flood_gate)
         
         # Mark as uploaded
         uploaded_files.add(file_path)
+        if state_log:
+            await state_log.add(file_path)
         
         # Complete progress bar
-        if progress_bar:
-            progress_bar.n = file_size
-            progress_bar.refresh()
-            progress_bar.close()
+        progress_bar.n = file_size
+        progress_bar.refresh()
         
-        print(f"{Fore.GREEN}✓ Uploaded: {filename}{Style.RESET_ALL}")
+        log(_GREEN, f"✓ Uploaded: {filename}")
         return True
         
     except Exception as e:
-        if progress_bar:
-            progress_bar.close()
-        
-        error_msg = str(e).lower()
-        if "peer validation failed" in error_msg or "invalid peer" in error_msg:
-            print(f"{Fore.RED}X Peer validation failed for {filename}. Channel may be inaccessible.{Style.RESET_ALL}")
-        elif "flood" in error_msg.lower():
-            print(f"{Fore.RED}X Rate limit exceeded. Please wait before uploading more files.{Style.RESET_ALL}")
-        elif "file" in error_msg.lower() and "large" in error_msg.lower():
-            print(f"{Fore.RED}X File {filename} is too large for upload.{Style.RESET_ALL}")
-        elif "permission" in error_msg.lower() or "forbidden" in error_msg.lower():
-            print(f"{Fore.RED}X Permission denied for {filename}. Check channel permissions.{Style.RESET_ALL}")
-        else:
-            print(f"{Fore.RED}X Failed to upload {filename}: {e}{Style.RESET_ALL}")
+        _report_upload_error(filename, e)
         return False
 
 
-async def upload_in_batches(client, files, channel, batch_size, uploaded_files, state_file, caption=None):
-    """Upload files in batches"""
-    tasks = []
-    progress_bars = []
+async def upload_album(client, recs, peer, progress_bar, uploaded_files, caption=None, state_log=None,
+                       flood_gate=None):
+    """Upload up to ALBUM_SIZE FileRecs as one album, returning how many were sent
+
+    send_file raises if any part of the album fails, so an album is either
+    sent whole or not at all.
+    """
+    paths = [rec.path for rec in recs]
+    label = f"album of {len(paths)} files"
+    
+    try:
+        sizes = [rec.size or 0 for rec in recs]
+        
+        # Telethon reports album progress in files (e.g. 2.5 of 10), so map
+        # that back onto bytes using the running total of the file sizes
+        offsets = list(itertools.accumulate(sizes, initial=0))
+        progress_bar.reset(total=offsets[-1])
+        progress_bar.set_description(f"Uploading {label}")
+        last_refresh = [0.0]
+        
+        def progress_callback(current, total):
+            index = int(current)
+            if index >= len(sizes):
+                progress_bar.n = offsets[-1]
+            else:
+                progress_bar.n = offsets[index] + int((current - index) * sizes[index])
+            now = time.monotonic()
+            if now - last_refresh[0] >= PROGRESS_REFRESH_INTERVAL or current >= total:
+                progress_bar.refresh()
+                last_refresh[0] = now
+        
+        # One request for the whole group; a list caption labels every item
+        await with_flood_retry(lambda: client.send_file(
+            peer,
+            paths,
+            caption=[caption] * len(paths) if caption else None,
+            progress_callback=progress_callback,
+        ), flood_gate)
+        
+        for path in paths:
+            uploaded_files.add(path)
+            if state_log:
+                await state_log.add(path)
+        
+        progress_bar.n = offsets[-1]
+        progress_bar.refresh()
+        
+        log(_GREEN, f"✓ Uploaded: {label}")
+        return len(paths)
+    
+    except Exception as e:
+        _report_upload_error(label, e)
+        return 0
+
+
+def album_groups(recs):
+    """Yield ALBUM_EXTS FileRecs in tuples of up to ALBUM_SIZE, and every other file on its own"""
+    media = []
+    for rec in recs:
+        if os.path.splitext(rec.name)[1].lower() not in ALBUM_EXTS:
+            yield (rec,)
+            continue
+        media.append(rec)
+        if len(media) == ALBUM_SIZE:
+            yield tuple(media)
+            media = []
+    if media:
+        yield tuple(media)
+
+
+def _report_upload_error(filename, e):
+    """Print a specific message for a failed upload"""
+    match = _ERR_RE.search(str(e))
+    if match:
+        message = _ERR_MSGS[match.lastgroup].format(filename=filename)
+    else:
+        message = f"X Failed to upload {filename}: {e}"
+    log(_RED, message)
+
+
+async def upload_in_batches(client, files, peer, concurrency, large_concurrency, uploaded_files, state_log,
+                            caption=None, album=False):
+    """Upload files with up to concurrency small and large_concurrency large files in flight
+
+    Files over BIG_FILE_SIZE draw from their own pool, mirroring Telegram's
+    separate small and large upload queues. With album set, photos are sent
+    ALBUM_SIZE at a time as albums, which count as small uploads; other
+    files, and albums Telegram rejects, go one at a time.
+    """
+    small_sem = asyncio.Semaphore(concurrency)
+    large_sem = asyncio.Semaphore(large_concurrency)
+    flood_gate = FloodGate()
     successful_uploads = 0
     failed_uploads = 0
     
-    for i, file_path in enumerate(files, 1):
-        tasks.append(upload_file(client, file_path, channel, progress_bars, uploaded_files, caption))
+    # One bar per concurrent upload, each on its own row and reused by
+    # whichever upload takes its slot next
+    slots = concurrency + large_concurrency
+    bars = [make_progress_bar(slot) for slot in range(slots)]
+    slot_queue = asyncio.Queue()
+    for slot in range(slots):
+        slot_queue.put_nowait(slot)
+    
+    async def _one(group, sem):
+        nonlocal successful_uploads, failed_uploads
+        slot = await slot_queue.get()
+        sent = 0
+        try:
+            if len(group) > 1:
+                sent = await upload_album(client, group, peer, bars[slot], uploaded_files, caption, state_log,
+                                          flood_gate)
+                if not sent:
+                    # Albums are all-or-nothing, so nothing from this one was posted
+                    log(_YEL, "! Retrying the album's files one at a time")
+            if not sent:
+                for rec in group:
+                    if await upload_file(client, rec, peer, bars[slot], uploaded_files, caption, state_log,
+                                         flood_gate) is True:
+                        sent += 1
+        except Exception as e:
+            # upload_file/upload_album report their own failures, so this is
+            # an unexpected error; the files not yet sent count as failed below
+            _report_upload_error(group[0].name if len(group) == 1 else f"album of {len(group)} files", e)
+        finally:
+            bars[slot].reset()
+            slot_queue.put_nowait(slot)
+            # Free the slot as soon as this file is done, so the next file
+            # starts without waiting for the slowest one in a batch
+            sem.release()
         
-        # Run in batches
-        if len(tasks) == batch_size or i == len(files):
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Count successful and failed uploads
-            for result in results:
-                if isinstance(result, Exception):
-                    failed_uploads += 1
-                elif result is True:
-                    successful_uploads += 1
-                else:
-                    failed_uploads += 1
-            
-            # Save state after each batch
-            save_upload_state(uploaded_files, state_file)
-            tasks.clear()
+        # Count successful and failed uploads
+        successful_uploads += sent
+        failed_uploads += len(group) - sent
+    
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for group in album_groups(files) if album else ((rec,) for rec in files):
+                # The walk already knows each file's size
+                size = group[0].size
+                sem = large_sem if len(group) == 1 and size and size > BIG_FILE_SIZE else small_sem
+                await sem.acquire()
+                tg.create_task(_one(group, sem))
+    finally:
+        for bar in bars:
+            bar.close()
     
-    # Provide detailed completion summary
-    total_files = len(files)
+    # Provide detailed completion summary; files may be a one-shot iterator
+    total_files = successful_uploads + failed_uploads
     if successful_uploads == total_files:
-        print(f"\n{Fore.GREEN}+ Upload completed successfully! {successful_uploads}/{total_files} files uploaded{Style.RESET_ALL}")
+        log(_GREEN, f"\n+ Upload completed successfully! {successful_uploads}/{total_files} files uploaded")
     elif successful_uploads > 0:
-        print(f"\n{Fore.YELLOW}! Upload partially completed: {successful_uploads}/{total_files} files uploaded, {failed_uploads} failed{Style.RESET_ALL}")
+        log(_YEL, f"\n! Upload partially completed: {successful_uploads}/{total_files} files uploaded, {failed_uploads} failed")
     else:
-        print(f"\n{Fore.RED}X Upload failed: 0/{total_files} files uploaded{Style.RESET_ALL}")
+        log(_RED, f"\nX Upload failed: 0/{total_files} files uploaded")
     
     return successful_uploads, failed_uploads
 
@@ -322,7 +704,7 @@ async def session_selection_menu(session_manager):
             if session_manager.sessions:
                 session_manager.list_sessions()
                 session_name = input(f"\n{Fore.CYAN}Enter session name: {Style.RESET_ALL}").strip()
-                if session_name and session_manager.switch_session(session_name):
+                if session_name and await session_manager.switch_session(session_name):
                     return session_manager.get_current_session()
             else:
                 print(f"{Fore.YELLOW}No sessions available{Style.RESET_ALL}")
@@ -359,19 +741,15 @@ async def add_session_interactive(session_manager):
         success = await session_manager.add_session(name, phone, api_id, api_hash)
         if success:
             # Automatically switch to the new session
-            session_manager.switch_session(name)
+            await session_manager.switch_session(name)
         
     except ValueError:
         print(f"{Fore.RED}Invalid API ID{Style.RESET_ALL}")
 
 
-async def main():
-    print(f"{Fore.CYAN}>> TELEGRAM MULTI-SESSION UPLOADER{Style.RESET_ALL}")
-    print(f"{Fore.CYAN}{'='*45}{Style.RESET_ALL}")
-    
-    # Initialize session manager
-    session_manager = SessionManager()
-    
+async def upload_with_session(session_manager, concurrency=DEFAULT_CONCURRENCY,
+                              large_concurrency=DEFAULT_LARGE_CONCURRENCY):
+    """Pick a session and target, then upload using the session's pooled client"""
     # Session selection
     session_info = await session_selection_menu(session_manager)
     if not session_info:
@@ -389,14 +767,22 @@ async def main():
         print(f"{Fore.GREEN}  Account: {session_info.first_name} {session_info.last_name or ''} ({session_info.phone_number}){Style.RESET_ALL}")
         
         # Select upload target
-        channel = await display_and_select_upload_target(client)
+        channel = await display_and_select_upload_target(client, session_info.name)
         if not channel:
             print(f"{Fore.RED}No channel selected. Exiting...{Style.RESET_ALL}")
-            await client.disconnect()
             return
         
         print(f"{Fore.YELLOW}Selected upload target: {channel.title} (ID: {channel.id}){Style.RESET_ALL}")
         
+        # Simple permission check (non-blocking), only needed for manually
+        # entered channels; ones picked from the list were already vetted
+        rights = None if getattr(channel, '_tgdus_validated', False) else getattr(channel, 'default_banned_rights', None)
+        if rights and rights.send_media:
+            print(f"{Fore.YELLOW}! Warning: May not have media permissions for {getattr(channel, 'title', 'Unknown')}{Style.RESET_ALL}")
+        
+        # Resolve the channel to an InputPeer once; channel stays for display
+        peer = await client.get_input_entity(channel)
+        
         # Choose upload mode
         print(
             f"{Fore.CYAN}Choose upload mode:{Style.RESET_ALL}\n"
@@ -411,7 +797,6 @@ async def main():
             
             if not file_path or not os.path.exists(file_path) or not os.path.isfile(file_path):
                 print(f"{Fore.RED}Invalid file path! Exiting...{Style.RESET_ALL}")
-                await client.disconnect()
                 return
             
             # Optional caption for single file
@@ -425,18 +810,17 @@ async def main():
             confirm = input(f"{Fore.YELLOW}Upload '{filename}' to {channel.title}? (y/n): {Style.RESET_ALL}")
             if confirm.lower() != 'y':
                 print(f"{Fore.YELLOW}Upload cancelled.{Style.RESET_ALL}")
-                await client.disconnect()
                 return
             
             # Upload single file
             print(f"{Fore.GREEN}Starting upload...{Style.RESET_ALL}")
-            progress_bars = []
             uploaded_files = set()
-            result = await upload_file(client, file_path, channel, progress_bars, uploaded_files, caption)
-            
-            # Close progress bars
-            for pb in progress_bars:
-                pb.close()
+            progress_bar = make_progress_bar()
+            try:
+                rec = FileRec(file_path, filename, None)
+                result = await upload_file(client, rec, peer, progress_bar, uploaded_files, caption)
+            finally:
+                progress_bar.close()
             
             if result:
                 print(f"\n{Fore.GREEN}+ Upload completed successfully! '{filename}' uploaded to {channel.title}{Style.RESET_ALL}")
@@ -449,7 +833,6 @@ async def main():
             
             if not folder_path or not os.path.exists(folder_path):
                 print(f"{Fore.RED}Invalid folder path! Exiting...{Style.RESET_ALL}")
-                await client.disconnect()
                 return
             
             # Choose file types
@@ -476,34 +859,28 @@ async def main():
                 file_types = None  # All files
             else:
                 print(f"{Fore.RED}Invalid choice! Exiting...{Style.RESET_ALL}")
-                await client.disconnect()
-                return
-            
-            # Get files to upload
-            files = get_files_from_folder(folder_path, file_types)
-            
-            if not files:
-                print(f"{Fore.RED}No files found to upload!{Style.RESET_ALL}")
-                await client.disconnect()
                 return
             
             # Load upload state
             state_file = os.path.join(folder_path, "upload_state.json")
             uploaded_files = load_upload_state(state_file)
             
-            # Filter out already uploaded files
-            original_count = len(files)
-            files = [f for f in files if f not in uploaded_files]
-            already_uploaded = original_count - len(files)
+            # Get files to upload, leaving out already uploaded ones during the walk.
+            # Walk the folder off the event loop so the connection keeps running
+            counts = {'found': 0, 'skipped': 0}
+            files = await asyncio.to_thread(get_files_from_folder, folder_path, file_types, uploaded_files, counts)
             
-            print(f"Found {original_count} total files.")
-            if already_uploaded > 0:
-                print(f"{Fore.YELLOW}{already_uploaded} files already uploaded (skipping){Style.RESET_ALL}")
+            if not counts['found']:
+                print(f"{Fore.RED}No files found to upload!{Style.RESET_ALL}")
+                return
+            
+            print(f"Found {counts['found']} total files.")
+            if counts['skipped'] > 0:
+                print(f"{Fore.YELLOW}{counts['skipped']} files already uploaded (skipping){Style.RESET_ALL}")
             print(f"{Fore.GREEN}{len(files)} new files to upload{Style.RESET_ALL}")
             
             if not files:
                 print(f"{Fore.YELLOW}All files have already been uploaded!{Style.RESET_ALL}")
-                await client.disconnect()
                 return
             
             # Optional caption
@@ -516,22 +893,27 @@ async def main():
             confirm = input(f"{Fore.YELLOW}Upload {len(files)} files to {channel.title}? (y/n): {Style.RESET_ALL}")
             if confirm.lower() != 'y':
                 print(f"{Fore.YELLOW}Upload cancelled.{Style.RESET_ALL}")
-                await client.disconnect()
                 return
             
             # Start upload
             print(f"{Fore.GREEN}Starting upload...{Style.RESET_ALL}")
-            batch_size = 5  # Default batch size
-            successful, failed = await upload_in_batches(client, files, channel, batch_size, uploaded_files, state_file, caption)
+            # Completed uploads are appended to the log in batches
+            state_log = UploadLog(upload_log_path(state_file))
+            try:
+                # Images go out as albums, one request per ALBUM_SIZE files
+                successful, failed = await upload_in_batches(client, files, peer, concurrency, large_concurrency,
+                                                             uploaded_files, state_log, caption,
+                                                             album=choice == "1")
+            finally:
+                await state_log.flush()
+                # Rewrite the snapshot off the loop; copy the set so nothing mutates it mid-dump
+                await asyncio.to_thread(compact_upload_state, set(uploaded_files), state_file)
             
             # Final summary is already printed by upload_in_batches function
         
         else:
             print(f"{Fore.RED}Invalid choice! Exiting...{Style.RESET_ALL}")
         
-        # Disconnect client
-        await client.disconnect()
-        
     except KeyboardInterrupt:
         print(f"\n{Fore.YELLOW}! Operation cancelled by user{Style.RESET_ALL}")
     except Exception as e:
@@ -539,5 +921,37 @@ async def main():
         print(f"{Fore.YELLOW}! Please check your session and internet connection{Style.RESET_ALL}")
 
 
+def parse_args():
+    """Parse command-line options, clamping concurrency to 1..MAX_CONCURRENCY"""
+    parser = argparse.ArgumentParser(description="Upload files to Telegram with support for multiple accounts")
+    parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+        help=f"parallel uploads of small files (1-{MAX_CONCURRENCY}, default {DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--large-concurrency", type=int, default=DEFAULT_LARGE_CONCURRENCY,
+        help=f"parallel uploads of files over 10 MiB (1-{MAX_CONCURRENCY}, default {DEFAULT_LARGE_CONCURRENCY})",
+    )
+    args = parser.parse_args()
+    args.concurrency = min(max(args.concurrency, 1), MAX_CONCURRENCY)
+    args.large_concurrency = min(max(args.large_concurrency, 1), MAX_CONCURRENCY)
+    return args
+
+
+async def main(concurrency=DEFAULT_CONCURRENCY, large_concurrency=DEFAULT_LARGE_CONCURRENCY):
+    print(f"{Fore.CYAN}>> TELEGRAM MULTI-SESSION UPLOADER{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}{'='*45}{Style.RESET_ALL}")
+    
+    # Initialize session manager
+    session_manager = await SessionManager.create()
+    try:
+        await upload_with_session(session_manager, concurrency, large_concurrency)
+    finally:
+        # Every client comes from the manager's pool (get_client reuses an
+        # open connection per session), so they are all closed once here
+        await session_manager.close_all()
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    asyncio.run(main(args.concurrency, args.large_concurrency))
\ No newline at end of file